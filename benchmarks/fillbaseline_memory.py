@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# encoding=utf8
+
+""" Measures the memory fillbaseline needs to collect the values of every value and field, with the values stored in
+arrays of doubles and, for comparison, in lists of Python numbers as before. Every storage is measured in a process of
+its own by the growth of its peak resident set size while grouping the rows (Linux and macOS).
+
+usage: python benchmarks/fillbaseline_memory.py [rows] [distinct values] [fields]
+"""
+
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+os.environ.setdefault("SPLUNK_HOME", os.getcwd())
+
+import fillbaseline
+
+def peak_rss():
+    """ Peak resident set size of this process in bytes """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def rows(row_count, value_count, fieldnames):
+    """ Yields the rows one by one, so that only the collected values stay in memory """
+    random.seed(0)
+    for i in xrange(row_count):
+        row = {"user": "user%d" % (i % value_count)}
+        for fieldname in fieldnames:
+            row[fieldname] = "%.3f" % random.gauss(10, 3)
+        yield row
+
+def measure(storage, row_count, value_count, fieldnames):
+    command = fillbaseline.FillBaselineCommand()
+    command.parser.parse(["config_name=cfg", "value=user"] + fieldnames, command)
+    if storage == "list":
+        command.new_data = list
+    before = peak_rss()
+    start = time.time()
+    data = command.group(rows(row_count, value_count, fieldnames))
+    seconds = time.time() - start
+    grown = peak_rss() - before
+    values = row_count * len(fieldnames)
+    print "%-6s %10.1f MB %8.1f bytes per value %8.1f s" % (storage, grown / 1048576.0, grown / float(values), seconds)
+    return data
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] in ("array", "list"):
+        storage = sys.argv.pop(1)
+    else:
+        storage = None
+    row_count = int(float(sys.argv[1])) if len(sys.argv) > 1 else 10000000
+    value_count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    fieldnames = ["field%d" % i for i in range(int(sys.argv[3]) if len(sys.argv) > 3 else 1)]
+
+    if storage is not None:
+        measure(storage, row_count, value_count, fieldnames)
+        return
+    print "%d rows, %d values, %d fields" % (row_count, value_count, len(fieldnames))
+    for storage in ("array", "list"):
+        subprocess.check_call([sys.executable, os.path.abspath(__file__), storage] + sys.argv[1:])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# encoding=utf8
+
+""" Checks that the NumPy and the pure Python medcouple return identical results on a fixed corpus of normal, skewed,
+heavy tailed and tied data sets, then measures both for growing n.
+
+usage: python benchmarks/medcouple_numpy.py [largest n]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+
+import medcouple
+
+def corpus():
+    """ Yields the data sets of the shared test corpus """
+    random.seed(7)
+    for n in [3, 4, 5, 7, 10, 20, 51, 99, 100, 101, 333, 1000, 2000, 5001]:
+        for i in xrange(6):
+            yield [random.gauss(0, 1) for j in xrange(n)]
+            yield [random.expovariate(1) for j in xrange(n)]
+            yield [random.lognormvariate(0, 1) for j in xrange(n)]
+            yield [-random.paretovariate(2) for j in xrange(n)]
+            # ties, also with the median
+            yield [random.randint(0, 5) for j in xrange(n)]
+            yield [round(random.gauss(0, 1), 1) for j in xrange(n)]
+
+def python_medcouple(data):
+    threshold = medcouple.numpy_threshold
+    medcouple.numpy_threshold = float("inf")
+    try:
+        return medcouple.medcouple_1d(data)
+    finally:
+        medcouple.numpy_threshold = threshold
+
+def numpy_medcouple(data):
+    threshold = medcouple.numpy_threshold
+    medcouple.numpy_threshold = 0
+    try:
+        return medcouple.medcouple_1d(data)
+    finally:
+        medcouple.numpy_threshold = threshold
+
+def main():
+    if medcouple.numpy is None:
+        print "NumPy is not installed"
+        return
+    largest = int(float(sys.argv[1])) if len(sys.argv) > 1 else 1000000
+
+    data_sets = 0
+    differences = 0
+    for data in corpus():
+        data_sets += 1
+        expected = python_medcouple(data)
+        result = numpy_medcouple(data)
+        if result != expected:
+            differences += 1
+            print "n=%d: numpy %r != python %r" % (len(data), result, expected)
+    print "%d of %d data sets differ" % (differences, data_sets)
+
+    print "%8s %12s %12s" % ("n", "python", "numpy")
+    n = 1000
+    while n <= largest:
+        data = [random.lognormvariate(0, 1) for i in xrange(n)]
+        start = time.time()
+        python_medcouple(data)
+        python_time = time.time() - start
+        start = time.time()
+        numpy_medcouple(data)
+        numpy_time = time.time() - start
+        print "%8d %11.3fs %11.3fs" % (n, python_time, numpy_time)
+        n *= 10
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# encoding=utf8
+
+""" Measures medcouple.wmedian against the previous implementation, which sorted the whole input on every iteration,
+and the resulting medcouple_1d run time. Both implementations must agree on the medcouple.
+
+usage: python benchmarks/medcouple_wmedian.py [largest n] [repetitions]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+
+import medcouple
+
+def sorting_wmedian(A, W):
+    """ wmedian before the selection based implementation """
+    AW = zip(A, W)
+    n = len(AW)
+    wtot = sum(W)
+    beg = 0
+    end = n - 1
+    while True:
+        mid = (beg + end)//2
+        AW = sorted(AW, key = lambda x: x[0])
+        trial = AW[mid][0]
+        wleft = wright = 0
+        for (a, w) in AW:
+            if a < trial:
+                wleft += w
+            else:
+                wright += w
+        if 2*wleft > wtot:
+            end = mid
+        elif 2*wright < wtot:
+            beg = mid
+        else:
+            return trial
+
+def best_of(repetitions, function, *args):
+    timings = []
+    for i in xrange(repetitions):
+        start = time.time()
+        result = function(*args)
+        timings.append(time.time() - start)
+    return min(timings), result
+
+def main():
+    largest = int(float(sys.argv[1])) if len(sys.argv) > 1 else 1000000
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    random.seed(0)
+    print "%8s %14s %14s %14s %14s" % ("n", "wmedian sort", "wmedian select", "medcouple sort", "medcouple select")
+    n = 1000
+    while n <= largest:
+        A = [random.random() for i in xrange(n)]
+        W = [random.randint(1, n) for i in xrange(n)]
+        sort_time, sort_result = best_of(repetitions, sorting_wmedian, A, W)
+        select_time, select_result = best_of(repetitions, medcouple.wmedian, A, W)
+
+        data = [random.lognormvariate(0, 1) for i in xrange(n)]
+        medcouple.wmedian = sorting_wmedian
+        try:
+            mc_sort_time, mc_sort = best_of(1, medcouple.medcouple_1d, data)
+        finally:
+            reload(medcouple)
+        mc_select_time, mc_select = best_of(1, medcouple.medcouple_1d, data)
+        if mc_sort != mc_select:
+            print "medcouple differs for n=%d: %r != %r" % (n, mc_sort, mc_select)
+        print "%8d %13.4fs %13.4fs %13.3fs %13.3fs" % (n, sort_time, select_time, mc_sort_time, mc_select_time)
+        n *= 10
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# encoding=utf8
+
+""" Measures the conversion of the field values of fillbaseline on int, float, mixed and text columns: the exception
+driven convertStr cell by cell against convert_column, which classifies the cells of a column. Both must return the
+same values of the same types.
+
+usage: python benchmarks/parse_numbers.py [values per column] [repetitions]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+os.environ.setdefault("SPLUNK_HOME", os.getcwd())
+
+import fillbaseline
+
+def columns(n):
+    random.seed(0)
+    yield "int", [str(random.randint(0, 1000)) for i in xrange(n)]
+    yield "float", ["%.3f" % random.gauss(0, 10) for i in xrange(n)]
+    yield "mixed", [random.choice([str(random.randint(-100, 100)), "%.2f" % random.random(), "%g" % random.expovariate(1e-6), "", "N/A"]) for i in xrange(n)]
+    yield "text", [random.choice(["", "N/A", "-", "GET", "timeout"]) for i in xrange(n)]
+
+def best_of(repetitions, function, column):
+    timings = []
+    for i in xrange(repetitions):
+        start = time.time()
+        result = function(column)
+        timings.append(time.time() - start)
+    return min(timings), result
+
+def main():
+    n = int(float(sys.argv[1])) if len(sys.argv) > 1 else 1000000
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    parsers = [
+        ("convertStr", lambda column: [fillbaseline.convertStr(s) for s in column]),
+        ("convert_column", fillbaseline.convert_column)
+    ]
+    print "%-8s %16s %16s" % tuple(["column"] + [name for name, parser in parsers])
+    for name, column in columns(n):
+        timings = []
+        expected = None
+        for parser_name, parser in parsers:
+            seconds, result = best_of(repetitions, parser, column)
+            result = [(type(value), value) for value in result]
+            if expected is None:
+                expected = result
+            elif result != expected:
+                print "%s differs from convertStr on the %s column" % (parser_name, name)
+            timings.append(seconds)
+        print "%-8s %15.3fs %15.3fs" % tuple([name] + timings)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# encoding=utf8
+
+""" Measures the per-chunk throughput of comparetobaseline scoring record by record and column by column with NumPy.
+
+usage: python benchmarks/score_chunk.py [records per chunk] [distinct values] [fields]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+os.environ.setdefault("SPLUNK_HOME", os.getcwd())
+
+import comparetobaseline
+import outlier_bounds
+
+def main():
+    chunk_size = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    value_count = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    fieldnames = ["field%d" % i for i in range(int(sys.argv[3]) if len(sys.argv) > 3 else 3)]
+
+    random.seed(0)
+    records = []
+    for i in xrange(chunk_size):
+        record = {"user": "user%d" % random.randrange(value_count)}
+        for fieldname in fieldnames:
+            record[fieldname] = "%.3f" % random.gauss(10, 3)
+        records.append(record)
+
+    stats = {"mean": 10, "stdev": 3, "median": 10, "mad": 2, "pct25": 8, "pct75": 12, "medcouple": 0.1}
+    bounds_table = {}
+    for i in xrange(value_count):
+        for fieldname in fieldnames:
+            bounds_table["cfg#user%d#%s" % (i, fieldname)] = (outlier_bounds.compute_bounds(stats, "Hampel"), stats)
+
+    command = comparetobaseline.CompareToBaselineCommand()
+    command.parser.parse(["config_name=cfg", "value=user"] + fieldnames, command)
+
+    engines = [("python", command.score)]
+    if comparetobaseline.numpy is not None:
+        engines.append(("numpy", command.score_vectorized))
+    else:
+        print "NumPy is not installed, skipping the vectorized engine"
+
+    for name, engine in engines:
+        timings = []
+        for i in range(5):
+            start = time.time()
+            for record in engine(records, bounds_table.get):
+                pass
+            timings.append(time.time() - start)
+        best = min(timings)
+        print "%-6s %8.3f s per chunk of %d records, %10.0f records/s" % (name, best, chunk_size, chunk_size / best)
+
+if __name__ == "__main__":
+    main()
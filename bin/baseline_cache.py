@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# encoding=utf8
+
+import json
+import os
+import time
+
+from collections import OrderedDict
+
+class LRUCache(object):
+    """ Bounded least recently used cache with an optional time to live per entry. Entries which are older than ttl
+    seconds are treated as missing. The cache counts hits and misses and can be saved to and loaded from a json file,
+    so that later invocations of the same search can start with a warm cache.
+    """
+
+    def __init__(self, size, ttl=None):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # key -> (expiry timestamp or None, value), least recently used first
+        self._entries = OrderedDict()
+
+    def __contains__(self, key):
+        # doesn't count as hit or miss and doesn't change the order of the entries
+        try:
+            expires, value = self._entries[key]
+        except KeyError:
+            return False
+        return expires is None or expires >= time.time()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """ Return the value stored for key and mark it as most recently used. """
+        try:
+            expires, value = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        if expires is not None and expires < time.time():
+            self.misses += 1
+            return default
+        self._entries[key] = (expires, value)
+        self.hits += 1
+        return value
+
+    def put(self, key, value, ttl=None):
+        """ Store value for key. ttl overrides the default time to live of the cache for this entry. """
+        ttl = ttl or self.ttl
+        self._entries.pop(key, None)
+        self._entries[key] = (time.time() + ttl if ttl else None, value)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def load(self, path):
+        """ Add the unexpired entries of a cache file written by save. Missing or unreadable files are ignored. """
+        try:
+            with open(path, 'rb') as f:
+                entries = json.load(f)
+        except (IOError, ValueError):
+            return
+        now = time.time()
+        for key, expires, value in entries:
+            # json loads the keys as unicode, the keys of the records are utf-8 encoded
+            if isinstance(key, unicode):
+                key = key.encode("utf-8")
+            if expires is None or expires >= now:
+                self._entries[key] = (expires, value)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def save(self, path):
+        """ Write the cache to path. The file is replaced atomically, a concurrent reader sees the old or the new
+        content but never a partial one.
+        """
+        temp_path = path + ".%d.tmp" % os.getpid()
+        with open(temp_path, 'wb') as f:
+            json.dump([[key, expires, value] for key, (expires, value) in self._entries.iteritems()], f)
+        try:
+            os.rename(temp_path, path)
+        except OSError:
+            # os.rename doesn't replace an existing file on windows
+            os.remove(path)
+            os.rename(temp_path, path)
+
+# caches shared by all command invocations of the current process
+_caches = {}
+
+def shared(name, size, ttl=None):
+    """ Return the process wide cache registered under name, create it if it doesn't exist yet. """
+    try:
+        cache = _caches[name]
+    except KeyError:
+        cache = _caches[name] = LRUCache(size, ttl)
+    cache.size = size
+    cache.ttl = ttl
+    return cache
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# encoding=utf8
+
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import time
+
+import seasons
+
+# statistics stored as float64 columns, None is stored as NaN
+columns = ["min", "pct25", "mean", "median", "pct75", "max", "stdev", "mad", "medcouple"]
+
+# magic, number of keys, length of the json metadata
+header = struct.Struct("<8sII")
+magic = "HBSNAP01"
+
+# the statistics of the slots of a seasonal baseline are stored as additional keys <key><slot_separator><slot>
+slot_separator = "\x1f"
+
+snapshot_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "snapshots")
+
+def _encode(key):
+    """ Keys are stored utf-8 encoded, values of events are utf-8 encoded already """
+    if isinstance(key, unicode):
+        return key.encode("utf-8")
+    return key
+
+def snapshot_path(kv_store, config_name):
+    """ Return the path of the snapshot of config_name exported from the collection kv_store. The name is made of the
+    readable characters of both and a hash of their exact values, so that names like "ui usage" and "ui_usage" don't
+    share a file.
+    """
+    kv_store, config_name = _encode(kv_store), _encode(config_name)
+    name = re.sub(r"[^A-Za-z0-9_.-]", "_", kv_store + "_" + config_name)
+    digest = hashlib.md5(kv_store + "\0" + config_name).hexdigest()[:12]
+    return os.path.join(snapshot_dir, name + "_" + digest + ".snapshot")
+
+def _padding(length):
+    return "\0" * (-length % 8)
+
+def write(path, kv_store, config_name, baselines):
+    """ Write a snapshot of the given baseline documents (field layout) to path. The file holds the json metadata, a
+    sorted index of the keys (offsets into the utf-8 encoded keys) and one float64 column per statistic, all aligned to
+    8 bytes. The file is replaced atomically. Returns the number of keys.
+    """
+    rows = {}
+    for baseline in baselines:
+        rows[_encode(baseline["_key"])] = baseline
+        if "season" in baseline:
+            for slot in xrange(seasons.slot_counts[baseline["season"]]):
+                stats = seasons.unpack(baseline["slots"], slot)
+                if stats is not None:
+                    rows[_encode(baseline["_key"]) + slot_separator + "%03d" % slot] = stats
+    keys = sorted(rows)
+    metadata = json.dumps({
+        "kv_store": kv_store,
+        "config_name": config_name,
+        "columns": columns,
+        # season of every key with slots
+        "seasons": dict((key.decode("utf-8"), rows[key]["season"]) for key in keys if "season" in rows[key]),
+        "exported": int(time.time())
+    })
+    offsets = [0]
+    for key in keys:
+        offsets.append(offsets[-1] + len(key))
+    nan = float("nan")
+
+    temp_path = path + ".%d.tmp" % os.getpid()
+    with open(temp_path, "wb") as f:
+        f.write(header.pack(magic, len(keys), len(metadata)))
+        f.write(metadata + _padding(header.size + len(metadata)))
+        f.write(struct.pack("<%dQ" % len(offsets), *offsets))
+        f.write("".join(keys) + _padding(offsets[-1]))
+        for column in columns:
+            values = [rows[key].get(column) for key in keys]
+            f.write(struct.pack("<%dd" % len(keys), *[nan if value is None else value for value in values]))
+    try:
+        os.rename(temp_path, path)
+    except OSError:
+        # os.rename doesn't replace an existing file on windows
+        os.remove(path)
+        os.rename(temp_path, path)
+    return len(keys)
+
+class Snapshot(object):
+    """ Read only, memory mapped snapshot written by write. Supports the mapping interface used for prefetched
+    baselines: keys are looked up with a binary search over the key index, only the pages touched are read.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        file_magic, self.count, metadata_length = header.unpack_from(self._map, 0)
+        if file_magic != magic:
+            raise ValueError("Not a baseline snapshot: %s" % path)
+        offset = header.size
+        self.metadata = json.loads(self._map[offset:offset + metadata_length])
+        offset += metadata_length + len(_padding(header.size + metadata_length))
+        self._offsets = offset
+        offset += 8 * (self.count + 1)
+        self._keys = offset
+        keys_length = struct.unpack_from("<Q", self._map, self._offsets + 8 * self.count)[0]
+        offset += keys_length + len(_padding(keys_length))
+        self._columns = offset
+        self._seasons = dict((_encode(key), season) for key, season in self.metadata["seasons"].iteritems())
+
+    def holds(self, kv_store, config_name):
+        """ True if the snapshot was exported for config_name from the collection kv_store """
+        return (_encode(self.metadata["kv_store"]), _encode(self.metadata["config_name"])) == (_encode(kv_store), _encode(config_name))
+
+    def _key(self, i):
+        start, end = struct.unpack_from("<2Q", self._map, self._offsets + 8 * i)
+        return self._map[self._keys + start:self._keys + end]
+
+    def _find(self, key):
+        """ Return the index of key or -1 """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self._key(low) == key:
+            return low
+        return -1
+
+    def _stats(self, i):
+        stats = {}
+        for j, column in enumerate(self.metadata["columns"]):
+            value = struct.unpack_from("<d", self._map, self._columns + 8 * (j * self.count + i))[0]
+            stats[column] = None if value != value else value
+        return stats
+
+    def get(self, key, default=None):
+        key = _encode(key)
+        i = self._find(key)
+        if i < 0:
+            return default
+        stats = self._stats(i)
+        season = self._seasons.get(key)
+        if season is not None:
+            slot_stats = []
+            for slot in xrange(seasons.slot_counts[season]):
+                j = self._find(key + slot_separator + "%03d" % slot)
+                slot_stats.append(self._stats(j) if j >= 0 else None)
+            stats["season"] = season
+            stats["slots"] = seasons.pack(slot_stats)
+        return stats
+
+    def __contains__(self, key):
+        return self._find(_encode(key)) >= 0
+
+    def __getitem__(self, key):
+        stats = self.get(key)
+        if stats is None:
+            raise KeyError(key)
+        return stats
+
+    def __len__(self):
+        return self.count
+
+# snapshots opened by this process, path -> (modification time, size, snapshot)
+_snapshots = {}
+
+def load(path):
+    """ Return the snapshot stored at path. A snapshot is mapped once per process and mapped again if the file has
+    been replaced since. Raises IOError if there is no snapshot.
+    """
+    stat = os.stat(path)
+    try:
+        mtime, size, snapshot = _snapshots[path]
+        if mtime == stat.st_mtime and size == stat.st_size:
+            return snapshot
+    except KeyError:
+        pass
+    snapshot = Snapshot(path)
+    _snapshots[path] = (stat.st_mtime, stat.st_size, snapshot)
+    return snapshot
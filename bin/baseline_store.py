@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# encoding=utf8
+
+import json
+import socket
+import threading
+import time
+
+from collections import OrderedDict
+from Queue import Queue
+from splunklib import binding
+
+collections_data_endpoint = 'storage/collections/data/'
+
+# fields of a document which identify a baseline, the other fields hold its statistics
+key_fields = ("_key", "_user", "config_name", "value", "field", "owner", "_time")
+
+def query_documents(service, kv_store, query, page_size=10000, fields=None):
+    """ Yields every document of the collection matching the given query. The documents are fetched in pages of
+    page_size documents, so that a single request never exceeds the max_rows_per_query limit of the KV store. The
+    pages are sorted by _key, without a sort order their boundaries aren't stable and documents could be skipped or
+    returned twice. If fields is given, only these fields of the documents are returned.
+    """
+    projection = {}
+    if fields:
+        projection["fields"] = ",".join(fields)
+    skip = 0
+    while True:
+        response = service.get(
+            collections_data_endpoint + kv_store,
+            owner = 'nobody',
+            app = 'SA-hyperbaseline',
+            query = json.dumps(query),
+            sort = "_key",
+            limit = page_size,
+            skip = skip,
+            **projection
+        )
+        documents = json.loads(str(response["body"]))
+        for document in documents:
+            yield document
+        # a short page is the last page
+        if len(documents) < page_size:
+            break
+        skip += page_size
+
+def query_baselines(service, kv_store, config_name, values=None, page_size=10000, values_per_query=100, fields=None):
+    """ Yields the baseline documents stored for config_name. If values is given only documents for these values are
+    fetched. The values are split into groups of values_per_query to keep the query string of a request short. The
+    queries are answered from the accelerated config_name, value and field index of collections.conf.
+    """
+    if values is None:
+        for document in query_documents(service, kv_store, {"config_name": config_name}, page_size, fields):
+            yield document
+        return
+    values = sorted(values)
+    for i in xrange(0, len(values), values_per_query):
+        query = {
+            "config_name": config_name,
+            "$or": [{"value": value} for value in values[i:i + values_per_query]]
+        }
+        for document in query_documents(service, kv_store, query, page_size, fields):
+            yield document
+
+def delete_documents(service, kv_store, keys, keys_per_query=100):
+    """ Delete the documents with the given keys, keys_per_query documents per request. """
+    keys = list(keys)
+    for i in xrange(0, len(keys), keys_per_query):
+        service.delete(
+            collections_data_endpoint + kv_store,
+            owner = 'nobody',
+            app = 'SA-hyperbaseline',
+            query = json.dumps({"$or": [{"_key": key} for key in keys[i:i + keys_per_query]]})
+        )
+
+def _encode(key):
+    """ Stored keys are unicode, the values and field names of events are utf-8 encoded """
+    if isinstance(key, unicode):
+        return key.encode("utf-8")
+    return key
+
+def consolidate(documents):
+    """ Combine documents of the field layout (one document per config_name, value and field) of the same config_name
+    and value into a document of the value layout, which holds the statistics of every field in its fields field.
+    """
+    documents = list(documents)
+    consolidated = OrderedDict()
+    consolidated["_key"] = documents[0]["config_name"] + "#" + documents[0]["value"]
+    consolidated["config_name"] = documents[0]["config_name"]
+    consolidated["value"] = documents[0]["value"]
+    consolidated["fields"] = OrderedDict()
+    for document in documents:
+        consolidated["fields"][document["field"]] = OrderedDict(
+            (name, stats) for name, stats in document.iteritems() if name not in key_fields)
+    consolidated["owner"] = documents[0].get("owner")
+    consolidated["_time"] = max(document.get("_time") for document in documents)
+    return consolidated
+
+def expand(document):
+    """ Yields the documents of the field layout combined in a document of the value layout. Their keys and field
+    names are utf-8 encoded like the values of events. Documents of the field layout are yielded as they are.
+    """
+    if "fields" not in document:
+        yield document
+        return
+    for fieldname, stats in document["fields"].iteritems():
+        fieldname = _encode(fieldname)
+        expanded = OrderedDict()
+        expanded["_key"] = _encode(document["_key"]) + "#" + fieldname
+        expanded["config_name"] = document["config_name"]
+        expanded["value"] = document["value"]
+        expanded["field"] = fieldname
+        expanded.update(stats)
+        for name in ("owner", "_time"):
+            if name in document:
+                expanded[name] = document[name]
+        yield expanded
+
+class BatchWriter(object):
+    """ Saves documents to the collection with batch_save requests of at most batch_size documents. Up to concurrency
+    batches are sent at the same time, write blocks while all of them are in flight, so at most 2 * concurrency
+    batches are held in memory. A batch which fails with a server error or a connection error is retried up to
+    retries times, waiting backoff seconds before the first retry and twice as long before every further one.
+    """
+
+    def __init__(self, service, kv_store, batch_size=1000, concurrency=1, retries=3, backoff=1.0):
+        self.service = service
+        self.kv_store = kv_store
+        self.batch_size = batch_size
+        self.retries = retries
+        self.backoff = backoff
+        self.documents = 0
+        self.batches = 0
+        self.seconds = 0.0
+        self._batch = []
+        self._error = None
+        self._lock = threading.Lock()
+        self._queue = Queue(concurrency)
+        self._started = time.time()
+        self._threads = [threading.Thread(target=self._work) for i in xrange(concurrency)]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def write(self, document):
+        self._batch.append(document)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """ Queue the documents written since the last flush """
+        if self._error is not None:
+            raise self._error
+        if self._batch:
+            self._queue.put(self._batch)
+            self._batch = []
+
+    def close(self):
+        """ Wait until all documents are saved. Raises the first error of a batch which couldn't be saved. """
+        self.flush()
+        for thread in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self.seconds = time.time() - self._started
+        if self._error is not None:
+            raise self._error
+
+    def _work(self):
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            if self._error is not None:
+                continue # drain the queue, close reports the error
+            try:
+                self._save(batch)
+            except Exception as e:
+                with self._lock:
+                    if self._error is None:
+                        self._error = e
+                continue
+            with self._lock:
+                self.documents += len(batch)
+                self.batches += 1
+
+    def _save(self, batch):
+        body = json.dumps(batch)
+        for attempt in xrange(self.retries + 1):
+            try:
+                return self.service.request(
+                    collections_data_endpoint + self.kv_store + "/batch_save",
+                    method = 'post',
+                    headers = [('content-type', 'application/json')],
+                    body = body,
+                    owner = 'nobody',
+                    app = 'SA-hyperbaseline'
+                )
+            except binding.HTTPError as e:
+                # client errors other than too many requests won't go away by retrying
+                if (e.status < 500 and e.status != 429) or attempt == self.retries:
+                    raise
+            except (socket.error, IOError):
+                if attempt == self.retries:
+                    raise
+            time.sleep(self.backoff * 2**attempt)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# encoding=utf8
+
+import os
+import sys
+import splunklib.client as client
+import splunklib.binding as binding
+import baseline_store
+import baseline_snapshot
+
+from splunklib.searchcommands import \
+    dispatch, GeneratingCommand, Configuration, Option, validators
+
+@Configuration()
+class BaselineExportCommand(GeneratingCommand):
+    """ Exports the baselines of a config_name to a snapshot file read by comparetobaseline source=snapshot.
+    ##Syntax
+    .. code-block::
+        baselineexport config_name=<string> [kv_store=<string>] [page_size=<int>]
+    ##Description:
+        Writes the statistics of every value and field of config_name to snapshots/<kv_store>_<config_name>_<hash>.snapshot in
+        the app directory: a sorted key index and one float64 column per statistic. comparetobaseline source=snapshot
+        memory maps the file and needs no requests to the key value store. Export again after running fillbaseline.
+    ##Example
+    ..code-block::
+        | baselineexport config_name="ui_usage"
+    """
+    config_name = Option(
+        doc='''
+        **Syntax:** **config_name=***<string>*
+        **Description:** Name of the baselines to export''',
+        require=True)
+
+    kv_store = Option(
+        doc='''
+        **Syntax:** **kv_store=***<string>*
+        **Description:** name of the collection the statistics are stored in''',
+        require=False, default="hyperbaseline")
+
+    page_size = Option(
+        doc='''
+        **Syntax:** **page_size=***<int>*
+        **Description:** number of documents fetched per request. Defaults to 10000''',
+        require=False, validate=validators.Integer(minimum=1), default=10000)
+
+    def generate(self):
+        app_service = client.Service(handler=binding.pooled_handler(), token=self.input_header["sessionKey"])
+        baselines = []
+        for document in baseline_store.query_baselines(app_service, self.kv_store, self.config_name, page_size=self.page_size):
+            baselines.extend(baseline_store.expand(document))
+        if not os.path.isdir(baseline_snapshot.snapshot_dir):
+            os.makedirs(baseline_snapshot.snapshot_dir)
+        path = baseline_snapshot.snapshot_path(self.kv_store, self.config_name)
+        keys = baseline_snapshot.write(path, self.kv_store, self.config_name, baselines)
+        yield {"config_name": self.config_name, "baselines": len(baselines), "keys": keys, "path": path, "bytes": os.path.getsize(path)}
+
+dispatch(BaselineExportCommand, sys.argv, sys.stdin, sys.stdout, __name__)
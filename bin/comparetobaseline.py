@@ -3,11 +3,23 @@
 
 import sys
 import splunklib.client as client
+import splunklib.binding as binding
 import json
 import custom_validators
-import math
+import baseline_store
+import baseline_cache
+import outlier_bounds
+import seasons
+import baseline_snapshot
+import os
 
 from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 from splunklib.searchcommands import \
     dispatch, StreamingCommand, Configuration, Option, validators
 
@@ -20,12 +32,12 @@ def map_score (value, bounds):
     else:
         return 1
 
-@Configuration()
+@Configuration(requires_srinfo=True)
 class CompareToBaselineCommand(StreamingCommand):
     """
     ##Syntax
     .. code-block::
-        comparetobaseline config_name=<string> variable=<fieldname> [kv_store=<string>] [threshold=<float>] [method=ESD|Hampel|SBR|ASBR] [debug=<boolean>] <field-list>
+        comparetobaseline config_name=<string> variable=<fieldname> [kv_store=<string>] [threshold=<float>] [method=ESD|Hampel|SBR|ASBR] [prefetch=none|all|chunk] [page_size=<int>] [source=kvstore|snapshot] [cache_size=<int>] [cache_ttl=<int>] [negative_ttl=<int>] [fetch_concurrency=<int>] [layout=field|value] [projection=<boolean>] [vectorize=<boolean>] [debug=<boolean>] <field-list>
     ##Description:
         Compare given values using statistical functions to identify an outlier. The 4 different outlier detection methods from
         the FindOutlier package in R are available.
@@ -70,83 +82,365 @@ class CompareToBaselineCommand(StreamingCommand):
     debug = Option(
         doc='''
         **Syntax:** **debug=***<boolean>*
-        **Description:** show the upper and lower bounds and key value store entry as columns if true. Defaults to false''',
+        **Description:** show the upper and lower bounds, key value store entry and cache hits and misses as columns if true. Defaults to false''',
         require=False, validate=validators.Boolean(), default=False)
 
+    prefetch = Option(
+        doc='''
+        **Syntax:** **prefetch=***none|all|chunk*
+        **Description:** Load the baselines with a few paged queries instead of one request per record and field. all loads every baseline of config_name, chunk only the baselines of the values seen in the current chunk of records. Defaults to none''',
+        require=False, validate=validators.Set("none", "all", "chunk"), default="none")
+
+    page_size = Option(
+        doc='''
+        **Syntax:** **page_size=***<int>*
+        **Description:** number of documents fetched per request when prefetching baselines. Defaults to 10000''',
+        require=False, validate=validators.Integer(minimum=1), default=10000)
+
+    source = Option(
+        doc='''
+        **Syntax:** **source=***kvstore|snapshot*
+        **Description:** kvstore fetches the baselines from the collection. snapshot reads them from the file written by baselineexport for config_name, without any request to the key value store. prefetch, cache and fetch options are not used with snapshot. Defaults to kvstore''',
+        require=False, validate=validators.Set("kvstore", "snapshot"), default="kvstore")
+
+    cache_size = Option(
+        doc='''
+        **Syntax:** **cache_size=***<int>*
+        **Description:** maximum number of baselines kept in the cache shared by all chunks of a search. The cache is stored in the dispatch directory of the search. 0 disables the cache. Defaults to 10000''',
+        require=False, validate=validators.Integer(minimum=0), default=10000)
+
+    cache_ttl = Option(
+        doc='''
+        **Syntax:** **cache_ttl=***<int>*
+        **Description:** number of seconds a cached baseline is used before it is fetched again. Defaults to 600''',
+        require=False, validate=validators.Integer(minimum=1), default=600)
+
+    negative_ttl = Option(
+        doc='''
+        **Syntax:** **negative_ttl=***<int>*
+        **Description:** number of seconds the cache remembers that no baseline exists for a key, so that later chunks don't request it again. Missing keys are always remembered for the current chunk. 0 disables caching of missing keys across chunks. Defaults to 0''',
+        require=False, validate=validators.Integer(minimum=0), default=0)
+
+    fetch_concurrency = Option(
+        doc='''
+        **Syntax:** **fetch_concurrency=***<int>*
+        **Description:** number of concurrent requests used to fetch the baselines which are not cached. If greater than 1, the baselines of all records of a chunk are fetched before the records are scored. Not used if prefetch is set. Defaults to 1''',
+        require=False, validate=validators.Integer(minimum=1), default=1)
+
+    layout = Option(
+        doc='''
+        **Syntax:** **layout=***field|value*
+        **Description:** layout the baselines were stored with by fillbaseline. With value the statistics of all fields of a value are fetched with a single request. Defaults to field''',
+        require=False, validate=validators.Set("field", "value"), default="field")
+
+    projection = Option(
+        doc='''
+        **Syntax:** **projection=***<boolean>*
+        **Description:** fetch only the statistics used by method (and the stored bounds) when prefetching baselines. Ignored if debug is true. Defaults to true''',
+        require=False, validate=validators.Boolean(), default=True)
+
+    vectorize = Option(
+        doc='''
+        **Syntax:** **vectorize=***<boolean>*
+        **Description:** score a chunk of records column by column with NumPy. Falls back to scoring record by record if NumPy is not available. Defaults to true''',
+        require=False, validate=validators.Boolean(), default=True)
+
     collections_data_endpoint = 'storage/collections/data/'
 
-    def stream(self, records):
-        app_service = client.Service(token=self.input_header["sessionKey"])
+    def fetch_baseline(self, app_service, key):
+        """ Fetch a single baseline document from the key value store. Returns an empty dict if no entry is found and
+        None if the request failed for another reason.
+        """
+        try:
+            request2 = app_service.request(
+                self.collections_data_endpoint + self.kv_store + "/" + key,
+                method = 'get',
+                headers = [('content-type', 'application/json')],
+                owner = 'nobody',
+                app = 'SA-hyperbaseline'
+            )
+            return json.loads(str(request2["body"]))
+        except binding.HTTPError as e:
+            if e.status == 404:
+                # no key value store entry found
+                return {}
+            return None
+        except:
+            # any other error is not remembered as missing key, continue
+            return None
+
+    def projected_fields(self):
+        """ Return the fields fetched by prefetch_baselines or None for all fields. """
+        if not self.projection or self.debug:
+            return None
+        fields = ["_key", "config_name", "value", "field", "bounds", "season"]
+        fields.extend(outlier_bounds.method_statistics[self.method])
+        fields.extend("slots." + name for name in ["bounds"] + list(outlier_bounds.method_statistics[self.method]))
+        if self.layout == "value":
+            # the statistics of the value layout are nested in the fields object
+            fields.append("fields")
+        return fields
+
+    def prefetch_baselines(self, app_service, values=None):
+        """ Load the baseline documents of config_name into a dict keyed by config_name#value#field. """
+        baselines = {}
+        for document in baseline_store.query_baselines(app_service, self.kv_store, self.config_name, values, self.page_size,
+                fields=self.projected_fields()):
+            # documents of the value layout hold the baselines of several fields
+            for baseline in baseline_store.expand(document):
+                key = baseline["_key"]
+                # stored keys are unicode, the keys of the records are utf-8 encoded
+                if isinstance(key, unicode):
+                    key = key.encode("utf-8")
+                baselines[key] = baseline
+        return baselines
+
+    def fetch_baselines(self, app_service, keys):
+        """ Fetch the baseline documents for keys with fetch_concurrency concurrent requests into a dict keyed by key.
+        Keys without baseline are mapped to an empty dict, keys whose request failed to None.
+        """
+        pool = ThreadPool(self.fetch_concurrency)
+        try:
+            documents = pool.map(lambda key: self.fetch_baseline(app_service, key), keys)
+        finally:
+            pool.close()
+        return dict(zip(keys, documents))
+
+    def expand_baselines(self, documents):
+        """ Map the documents of the value layout fetched for config_name#value keys to config_name#value#field keys.
+        Fields without baseline are mapped to an empty dict, the fields of failed requests to None.
+        """
+        baselines = {}
+        for value_key, document in documents.iteritems():
+            for fieldname in self.fieldnames:
+                baselines[value_key+"#"+fieldname] = None if document is None else {}
+            if document:
+                for baseline in baseline_store.expand(document):
+                    baselines[baseline["_key"]] = baseline
+        return baselines
+
+    def cache_path(self):
+        """ Return the path of the cache file in the dispatch directory or None if the search provides no info path. """
+        try:
+            info_path = self.input_header["infoPath"]
+        except KeyError:
+            return None
+        return os.path.join(os.path.dirname(info_path), "hyperbaseline_cache_" + self.cache_name() + ".json")
+
+    def cache_name(self):
+        """ Name of the cache of the baselines, baselines fetched with a projection are cached per method. """
+        if self.prefetch != "none" and self.projected_fields() is not None:
+            return self.kv_store + "_" + self.method
+        return self.kv_store
+
+    def lookup_baseline(self, app_service, key, baselines, cache, missing_keys):
+        """ Return the baseline document for key from the cache, the prefetched baselines or the key value store. An
+        empty dict is returned for keys without baseline, these are remembered in missing_keys and, if negative_ttl is
+        set, in the cache.
+        """
+        if key in missing_keys:
+            return {}
+        if cache is not None:
+            response_json = cache.get(key)
+            if response_json is not None:
+                return response_json
+        if baselines is not None and key in baselines:
+            response_json = baselines[key]
+        elif self.prefetch == "all" or self.source == "snapshot":
+            # every baseline of config_name has been prefetched or is in the snapshot
+            response_json = {}
+        elif self.layout == "value":
+            # fetch the baselines of all fields of the value, the other fields are served from baselines
+            value_key = key.rsplit("#", 1)[0]
+            document = self.fetch_baseline(app_service, value_key)
+            value_baselines = self.expand_baselines({value_key: document})
+            if baselines is not None and document is not None:
+                baselines.update(value_baselines)
+            response_json = value_baselines[key]
+        else:
+            # no prefetch or the key was cached when the chunk was prefetched but has expired since
+            response_json = self.fetch_baseline(app_service, key)
+        if response_json == {}:
+            missing_keys.add(key)
+            if cache is not None and self.negative_ttl:
+                cache.put(key, response_json, self.negative_ttl)
+        elif response_json and cache is not None:
+            cache.put(key, response_json)
+        return response_json
+
+    def score(self, records, resolve):
+        """ Score the records one by one. resolve returns the (bounds, baseline) of a key or None. """
         for record in records:
             new_record = OrderedDict()
             for fieldname in record:
                 new_record[fieldname] = record[fieldname]
                 if fieldname in self.fieldnames:
-                    # initialize empty response_json outside of the try except clause
-                    response_json = ""
                     new_record[fieldname+":score"] = -1
-                    key = self.config_name+"#"+record[self.value]+"#"+fieldname
-                    try:
-                        request2 = app_service.request(
-                            self.collections_data_endpoint + self.kv_store + "/" + key,
-                            method = 'get',
-                            headers = [('content-type', 'application/json')],
-                            owner = 'nobody',
-                            app = 'SA-hyperbaseline'
-                        )
-                        response_json = json.loads(str(request2["body"]))
-                    except:
-                        # if no key value store entry is found continue
-                        pass
-                    if response_json:
-                        if self.method == "ESD":
-                            # set default threshold if option is empty
-                            t = self.threshold or 3
-                            #extreme Studentized deviation bounds are [mean - t * SD, mean + t * SD]
-                            lower_bound = response_json["mean"] - t * response_json["stdev"]
-                            upper_bound = response_json["mean"] + t * response_json["stdev"]
-                        elif self.method == "Hampel":
-                            # set default threshold if option is empty
-                            t = self.threshold or 3
-                            # Hampel bounds are [median - t * MAD, median + t * MAD]
-                            lower_bound = response_json["median"] - t * response_json["mad"]
-                            upper_bound = response_json["median"] + t * response_json["mad"]
-                        elif self.method == "SBR":
-                            # set default threshold if option is empty
-                            c = self.threshold or 1.5
-                            # standard boxplot rule bounds are [Q1 - c * IQD, Q3 + c * IQD]
-                            # calculate the IQD (inter quartile distance)
-                            iqd = response_json["pct75"] - response_json["pct25"]
-                            lower_bound = response_json["pct25"] - c * iqd
-                            upper_bound = response_json["pct75"] + c * iqd
-                        elif self.method == "ASBR":
-                            # set default threshold if option is empty
-                            c = self.threshold or 1.5
-                            a = -4
-                            b = 3
-                            mc = float(response_json["medcouple"])
-                            # asymmetric standard boxplot rule bounds for positive MC are [Q1 – c * exp(a * MC) * IQD, Q3 + c * exp(b * MC) * IQD ]
-                            # asymmetric standard boxplot rule bounds for negative MC are [Q1 – c * exp(-b * MC) * IQD, Q3 + c * exp(-a * MC) * IQD ]
-                            # calculate the IQD (inter quartile distance)
-                            iqd = response_json["pct75"] - response_json["pct25"]
-                            if mc >= 0:
-                                lower_adjustment_factor = c * math.exp(a * mc) * iqd
-                                upper_adjustment_factor = c * math.exp(b * mc) * iqd
-                            else:
-                                lower_adjustment_factor = c * math.exp(-b * mc) * iqd
-                                upper_adjustment_factor = c * math.exp(-a * mc) * iqd
-                            lower_bound = response_json["pct25"] - lower_adjustment_factor
-                            upper_bound = response_json["pct75"] + upper_adjustment_factor
-
-                        # combine lower and upper bound into a list
-                        bounds = [lower_bound, upper_bound]
+                    entry = resolve(self.config_name+"#"+record[self.value]+"#"+fieldname, record)
+                    if entry is not None:
+                        bounds, response_json = entry
                         # score the value according to the calculated bounds
                         new_record[fieldname+":score"] = map_score(float(new_record[fieldname]), bounds)
                         # add the bounds and retrieved values if debug is true
                         if self.debug:
                             new_record[fieldname+":bounds"] = bounds
                             new_record[fieldname+":stats"] = response_json
+            yield new_record
+
+    def score_vectorized(self, records, resolve):
+        """ Score a chunk of records column by column with NumPy. The bounds are resolved once per distinct value and
+        joined to the records by index, the scores of a field are calculated with two array comparisons. Yields the
+        same records as score.
+        """
+        # distinct values and the index of the value of every record
+        values, value_index = numpy.unique([record[self.value] for record in records], return_inverse=True)
+        columns = {}
+        for fieldname in self.fieldnames:
+            rows = numpy.array([i for i, record in enumerate(records) if fieldname in record], dtype=numpy.intp)
+            if not len(rows):
+                continue
+            # only the values of records holding the field are resolved, the others would be fetched for nothing
+            present = numpy.zeros(len(values), dtype=bool)
+            present[value_index[rows]] = True
+            entries = [resolve(self.config_name+"#"+value+"#"+fieldname) if is_present else None
+                       for value, is_present in zip(values.tolist(), present.tolist())]
+            found = numpy.array([entry is not None for entry in entries], dtype=bool)
+            lower = numpy.array([entry[0][0] if entry is not None else numpy.nan for entry in entries], dtype=numpy.float64)
+            upper = numpy.array([entry[0][1] if entry is not None else numpy.nan for entry in entries], dtype=numpy.float64)
+            rows = rows[found[value_index[rows]]]
+            row_lower = lower[value_index[rows]]
+            row_upper = upper[value_index[rows]]
+            # records of seasonal baselines are resolved one by one, they use the bounds of the slot of their _time
+            row_entries = {}
+            seasonal = numpy.array([entry is not None and "season" in entry[1] for entry in entries], dtype=bool)
+            if seasonal.any():
+                keep = numpy.ones(len(rows), dtype=bool)
+                for j in numpy.flatnonzero(seasonal[value_index[rows]]).tolist():
+                    row = int(rows[j])
+                    entry = row_entries[row] = resolve(self.config_name+"#"+records[row][self.value]+"#"+fieldname, records[row])
+                    if entry is None:
+                        keep[j] = False
+                    else:
+                        row_lower[j], row_upper[j] = entry[0]
+                rows, row_lower, row_upper = rows[keep], row_lower[keep], row_upper[keep]
+            # only values with baseline are converted to float, like in score
+            x = numpy.array([records[i][fieldname] for i in rows.tolist()], dtype=str).astype(numpy.float64)
+            scores = numpy.full(len(records), -1, dtype=int)
+            scores[rows] = numpy.where((row_lower <= x) & (x <= row_upper), 0, 1)
+            columns[fieldname] = (scores.tolist(), entries, row_entries)
 
+        value_index = value_index.tolist()
+        for i, record in enumerate(records):
+            # only the first record defines the order of the output columns, plain dicts are much faster to fill
+            new_record = OrderedDict() if i == 0 else {}
+            for fieldname in record:
+                new_record[fieldname] = record[fieldname]
+                if fieldname in columns:
+                    scores, entries, row_entries = columns[fieldname]
+                    new_record[fieldname+":score"] = scores[i]
+                    # add the bounds and retrieved values if debug is true
+                    if self.debug and scores[i] != -1:
+                        bounds, response_json = row_entries.get(i) or entries[value_index[i]]
+                        new_record[fieldname+":bounds"] = bounds
+                        new_record[fieldname+":stats"] = response_json
             yield new_record
 
+    def stream(self, records):
+        app_service = client.Service(handler=binding.pooled_handler(), token=self.input_header["sessionKey"])
+        cache = None
+        cache_path = None
+        if self.cache_size and self.source != "snapshot":
+            # baselines fetched with different projections must not be mixed
+            cache = baseline_cache.shared(self.cache_name(), self.cache_size, self.cache_ttl)
+            cache_path = self.cache_path()
+            if cache_path is not None:
+                # warm start with the baselines fetched by previous chunks of this search
+                cache.load(cache_path)
+        # keys without baseline, each of them is requested at most once per chunk
+        missing_keys = set()
+        # (key, slot) -> (bounds, baseline) or None for keys without baseline
+        bounds_table = {}
+        # baselines stays None if every key has to be fetched on its own
+        baselines = None
+        if self.source == "snapshot":
+            # memory mapped, the keys are looked up in the file
+            try:
+                baselines = baseline_snapshot.load(baseline_snapshot.snapshot_path(self.kv_store, self.config_name))
+            except (IOError, OSError):
+                raise ValueError("No snapshot of %s found, run baselineexport first" % self.config_name)
+            if not baselines.holds(self.kv_store, self.config_name):
+                raise ValueError("The snapshot of %s holds the baselines of %s, run baselineexport again" % (self.config_name, baselines.metadata["config_name"]))
+        elif self.prefetch == "all":
+            baselines = self.prefetch_baselines(app_service)
+        elif self.prefetch == "chunk":
+            # the records of a chunk have to be read completely to know which values are needed
+            records = list(records)
+            values = set(record[self.value] for record in records)
+            if cache is not None:
+                # values with all fields cached need not be fetched again, missing keys are cached as well
+                values = set(value for value in values if any(
+                    self.config_name+"#"+value+"#"+fieldname not in cache for fieldname in self.fieldnames))
+            baselines = self.prefetch_baselines(app_service, values)
+            # keys of the prefetched values without document have no baseline
+            for value in values:
+                for fieldname in self.fieldnames:
+                    baselines.setdefault(self.config_name+"#"+value+"#"+fieldname, {})
+        elif self.fetch_concurrency > 1:
+            # collect the distinct keys of the chunk which are not cached and fetch them in parallel
+            records = list(records)
+            keys = set()
+            for record in records:
+                for fieldname in self.fieldnames:
+                    if fieldname in record:
+                        key = self.config_name+"#"+record[self.value]+"#"+fieldname
+                        if cache is None or key not in cache:
+                            keys.add(key)
+            if self.layout == "value":
+                value_keys = set(key.rsplit("#", 1)[0] for key in keys)
+                baselines = self.expand_baselines(self.fetch_baselines(app_service, sorted(value_keys)))
+            else:
+                baselines = self.fetch_baselines(app_service, sorted(keys))
+        elif self.layout == "value":
+            # filled with the baselines of the other fields whenever a value is fetched
+            baselines = {}
+        # key -> baseline document or None
+        documents = {}
+        def resolve(key, record=None):
+            """ Return (bounds, baseline) for key or None if there is no baseline. For seasonal baselines the statistics
+            of the slot of the _time of record are used.
+            """
+            if key not in documents:
+                documents[key] = self.lookup_baseline(app_service, key, baselines, cache, missing_keys) or None
+            response_json = documents[key]
+            if response_json is None:
+                return None
+            slot = None
+            if "season" in response_json and record is not None and "_time" in record:
+                slot = seasons.slot(response_json["season"], seasons.hour_of_week(record["_time"]))
+            # the bounds are calculated once per key, slot and chunk, not for every record
+            if (key, slot) not in bounds_table:
+                stats = response_json if slot is None else seasons.unpack(response_json["slots"], slot)
+                # e.g. a slot with a single data point has no stdev, it can't be scored with ESD
+                if stats and all(stats.get(name) is not None for name in outlier_bounds.method_statistics[self.method]):
+                    # use the bounds stored by fillbaseline if there are any for method and threshold
+                    bounds = outlier_bounds.stored_bounds(stats, self.method, self.threshold) or \
+                        outlier_bounds.compute_bounds(stats, self.method, self.threshold)
+                    bounds_table[(key, slot)] = (bounds, stats)
+                else:
+                    bounds_table[(key, slot)] = None
+            return bounds_table[(key, slot)]
+
+        if self.vectorize and numpy is not None:
+            scored_records = self.score_vectorized(list(records), resolve)
+        else:
+            scored_records = self.score(records, resolve)
+        for new_record in scored_records:
+            if self.debug and cache is not None:
+                new_record["cache:hits"] = cache.hits
+                new_record["cache:misses"] = cache.misses
+            yield new_record
+
+        if cache_path is not None:
+            cache.save(cache_path)
+
 dispatch(CompareToBaselineCommand, sys.argv, sys.stdin, sys.stdout, __name__)
@@ -1,4 +1,5 @@
 from splunklib.searchcommands.validators import Validator
+from splunklib.searchcommands import validators
 
 class Float(Validator):
     """ Validates Float option values.
@@ -25,3 +26,69 @@ class OutlierMethod(Validator):
         if value not in OutlierMethod.outlier_methods:
             raise ValueError('Unrecognized outlier method value: %s' % value)
         return value
+
+class FloatList(Validator):
+    """ Validates lists of Float option values separated by commas or spaces.
+    """
+
+    def __call__(self, value):
+        if value is not None and not isinstance(value, list):
+            try:
+                value = [float(v) for v in value.replace(",", " ").split()]
+            except ValueError:
+                raise ValueError('Cannot convert value to list of floats: %s' % value)
+        return value
+
+    def format(self, value):
+        return ",".join("%g" % v for v in value)
+
+class Span(Validator):
+    """ Validates time span option values like 3600, 90m, 12h, 7d or 2w and converts them to seconds.
+    """
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+    def __call__(self, value):
+        if value is not None and not isinstance(value, (int, long, float)):
+            unit = value[-1:].lower()
+            number = value[:-1] if unit in Span.units else value
+            try:
+                value = float(number) * Span.units.get(unit, 1)
+            except ValueError:
+                raise ValueError('Cannot convert value to time span: %s' % value)
+            if value <= 0:
+                raise ValueError('Time span must be positive: %s' % value)
+        return value
+
+    def format(self, value):
+        return "%gs" % value
+
+class Size(Validator):
+    """ Validates memory size option values like 512MB, 2GB or 1048576B and converts them to bytes. Numbers without
+    unit are megabytes.
+    """
+    units = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3, "TB": 1024 ** 4}
+
+    def __call__(self, value):
+        if value is not None and not isinstance(value, (int, long)):
+            number = value.rstrip("BKMGTbkmgt")
+            unit = value[len(number):].upper() or "MB"
+            if unit not in Size.units:
+                raise ValueError('Unrecognized memory size unit: %s' % value)
+            try:
+                value = int(float(number) * Size.units[unit])
+            except ValueError:
+                raise ValueError('Cannot convert value to memory size: %s' % value)
+            if value <= 0:
+                raise ValueError('Memory size must be positive: %s' % value)
+        return value
+
+    def format(self, value):
+        return "%dB" % value
+
+class Set(validators.Set):
+    """ Validates set option values. Unlike validators.Set, values can be formatted, which reporting commands need to
+    pass their options on to map.
+    """
+
+    def format(self, value):
+        return value
@@ -1,18 +1,59 @@
 #!/usr/bin/env python
 
+import os
+import re
 import sys
+import bisect
+import heapq
+import multiprocessing
+import tempfile
 import splunklib.client as client
+import splunklib.binding as binding
 import math
 import functools
 import json
 import medcouple
 import time
+import custom_validators
+import outlier_bounds
+import sketches
+import baseline_store
+import seasons
+import partitions
 
+from array import array
+from itertools import islice, izip, repeat
 from xml.dom import minidom
 from collections import OrderedDict
 from splunklib.searchcommands import \
     dispatch, ReportingCommand, Configuration, Option, validators
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# estimated memory of the values collected by group: a value with its fields, a collection of values of a field and
+# a value in an array of doubles, summaries are estimated by their compression
+value_bytes = 512
+collection_bytes = 128
+array_value_bytes = 8
+summary_bytes_per_compression = 100
+
+# partitions a spilled partition is split into and how often a partition is split again at most
+partition_count = 16
+max_partition_depth = 4
+
+# decimal numbers as accepted by int and float, a number without any of the groups is an int. int also accepts
+# spaces after the sign.
+number_pattern = re.compile(r"[ \t\n\r\f\v]*(?:[-+]?[ \t\n\r\f\v]*\d+|[-+]?(?:\d+(\.\d*)?|(\.)\d+)([eE][-+]?\d+)?)[ \t\n\r\f\v]*$")
+# strings int or float may accept although number_pattern doesn't match: nan and infinity, characters beyond
+# printable ascii like unicode digits or spaces
+other_number_pattern = re.compile(r"(?i)nan|inf|[^ -~\t\n\r\f\v]")
+
+# records converted column by column at once
+parse_chunk_size = 1000
+
 def convertStr(s):
     """Convert string to either int or float."""
     try:
@@ -25,6 +66,36 @@ def convertStr(s):
             ret = None
     return ret
 
+def convert_column(column):
+    """Convert a list of strings like convertStr."""
+    try:
+        # columns of ints are common and converted fastest without classifying them
+        return [int(s) for s in column]
+    except (ValueError, TypeError):
+        pass
+    match = number_pattern.match
+    other_search = other_number_pattern.search
+    converted = []
+    append = converted.append
+    for s in column:
+        m = match(s)
+        if m is not None:
+            append(int(s) if m.lastindex is None else float(s))
+        elif other_search(s) is None:
+            append(None)
+        else:
+            append(convertStr(s))
+    return converted
+
+def chunks(iterable, size):
+    """Yields lists of size items of iterable, the last one may be shorter."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
 def mean(data):
     """Return the sample arithmetic mean of data."""
     n = len(data)
@@ -71,12 +142,62 @@ def percentile(N, percent, key=lambda x:x):
 # median is 50th percentile.
 median = functools.partial(percentile, percent=0.5)
 
+def median_absolute_deviation(N, center):
+    """
+    Find the median of the absolute deviations of a list of values from center in linear time.
+
+    @parameter N - is a list of values. Note N MUST BE already sorted.
+    @parameter center - the value the deviations are calculated from, usually the median of N.
+
+    @return - the median absolute deviation, interpolated like median
+    """
+    if not N:
+        return None
+    n = len(N)
+    # the deviations of the values below and above center are sorted already, merge them from center outwards
+    # until the middle deviations are reached
+    above = bisect.bisect_left(N, center)
+    below = above - 1
+    lower = deviation = None
+    for k in xrange(n // 2 + 1):
+        if above < n and (below < 0 or N[above] - center <= center - N[below]):
+            deviation = N[above] - center
+            above += 1
+        else:
+            deviation = center - N[below]
+            below -= 1
+        if k == (n - 1) // 2:
+            lower = deviation
+    if n % 2 == 1:
+        return deviation
+    return lower * 0.5 + deviation * 0.5
+
+def sort_values(data):
+    """Sort an array('d') of values in place."""
+    if numpy is not None and len(data) > 1:
+        numpy.frombuffer(data, dtype=numpy.float64).sort()
+    else:
+        # without numpy the values are sorted as a temporary list of floats
+        data[:] = array('d', sorted(data))
+
+def order_statistics(N, n):
+    """
+    Return n evenly spaced order statistics of a list of values, including the minimum and the maximum.
+
+    @parameter N - is a list of values. Note N MUST BE already sorted.
+    @parameter n - number of order statistics, at least 2. All of N is returned if it isn't longer than n.
+    """
+    if len(N) <= n:
+        return N
+    step = (len(N) - 1) / float(n - 1)
+    return [N[int(round(i * step))] for i in xrange(n)]
+
 @Configuration(clear_required_fields=True, requires_preop=True)
 class FillBaselineCommand(ReportingCommand):
     """ Computes basic statistics for a given timeseries generated with timechart command. Bare in mind to set the limit and useother options of the timechart command according to your needs.
     ##Syntax
     .. code-block::
-        fillbaseline config_name=<string> variable=<fieldname> [kv_store=<string>] <field-list>
+        fillbaseline config_name=<string> variable=<fieldname> [kv_store=<string>] [bounds=<boolean>] [thresholds=<float-list>] [sketch=<boolean>] [compression=<int>] [decay=<span>] [medcouple_sample=<int>] [season=hour|wday|hour_of_week] [mode=replace|merge] [layout=field|value] [batch_size=<int>] [write_concurrency=<int>] [workers=<int>] [max_memory=<size>] <field-list>
     ##Description:
         Calculate basic statistics mad, max, mean, medcouple, median, min, pct25, pct75 and stdev aggregated by the field provided as variable parameter. \
         The calculated statistics are stored in a collection (default collection = hyperbaseline) and will be used by the comparetobaseline command for scoring. \
@@ -105,59 +226,504 @@ class FillBaselineCommand(ReportingCommand):
         **Description:** name of the collection the statistics will be stored in''',
         require=False, default="hyperbaseline")
 
-    collections_data_endpoint = 'storage/collections/data/'
+    bounds = Option(
+        doc='''
+        **Syntax:** **bounds=***<boolean>*
+        **Description:** store the bounds of the outlier detection methods ESD, Hampel, SBR and ASBR for their default thresholds with the statistics, so that comparetobaseline needn't calculate them. Defaults to false''',
+        require=False, validate=validators.Boolean(), default=False)
 
-    def reduce(self, records):
-        xml_doc = minidom.parseString(self.input_header["authString"])
-        user_id = xml_doc.getElementsByTagName('userId')[0].firstChild.nodeValue
+    thresholds = Option(
+        doc='''
+        **Syntax:** **thresholds=***<float-list>*
+        **Description:** additional thresholds the bounds are stored for, e.g. thresholds="2,2.5". Implies bounds=true''',
+        require=False, validate=custom_validators.FloatList())
+
+    sketch = Option(
+        doc='''
+        **Syntax:** **sketch=***<boolean>*
+        **Description:** calculate the statistics with bounded memory per value and field. pct25, median, pct75, mad and medcouple are estimated from a t-digest, min, max, mean and stdev are exact. Defaults to false''',
+        require=False, validate=validators.Boolean(), default=False)
+
+    compression = Option(
+        doc='''
+        **Syntax:** **compression=***<int>*
+        **Description:** compression of the t-digest used if sketch is true. Higher values give more accurate estimates and use more memory. Defaults to 100''',
+        require=False, validate=validators.Integer(minimum=20), default=100)
+
+    decay = Option(
+        doc='''
+        **Syntax:** **decay=***<span>*
+        **Description:** half-life of the weight of a record, e.g. decay=7d. Records are weighted by their _time, so that the statistics follow a drifting baseline. The statistics are calculated with bounded memory like with sketch=true. Not set by default''',
+        require=False, validate=custom_validators.Span())
+
+    medcouple_sample = Option(
+        doc='''
+        **Syntax:** **medcouple_sample=***<int>*
+        **Description:** calculate the medcouple on at most this many evenly spaced order statistics of the values of a value and field, which bounds the time needed for values with many data points. The sample size used is stored as medcouple_sample. Not set by default, the medcouple is exact unless sketch is true''',
+        require=False, validate=validators.Integer(minimum=3))
+
+    season = Option(
+        doc='''
+        **Syntax:** **season=***hour|wday|hour_of_week*
+        **Description:** calculate the statistics for every hour of the day, day of the week or hour of the week (local time of _time) in addition to the statistics of all records. The statistics of the slots are stored as arrays in the same document, comparetobaseline picks the slot of a record by its _time. Not set by default''',
+        require=False, validate=custom_validators.Set(*seasons.slot_counts.keys()))
+
+    mode = Option(
+        doc='''
+        **Syntax:** **mode=***replace|merge*
+        **Description:** replace calculates the statistics from the given records only. merge adds the given records to the statistics stored by previous runs with mode=merge, so only new data has to be searched. merge stores the values (or the sketch if sketch is true) in addition to the statistics. Defaults to replace''',
+        require=False, validate=custom_validators.Set("replace", "merge"), default="replace")
+
+    layout = Option(
+        doc='''
+        **Syntax:** **layout=***field|value*
+        **Description:** field stores one document per value and field, value stores one document per value holding the statistics of every field, which needs fewer documents and lookups. comparetobaseline has to be called with the same layout. Defaults to field''',
+        require=False, validate=custom_validators.Set("field", "value"), default="field")
+
+    batch_size = Option(
+        doc='''
+        **Syntax:** **batch_size=***<int>*
+        **Description:** number of documents saved to the KV store per request. Must not exceed max_documents_per_batch_save in limits.conf. Defaults to 1000''',
+        require=False, validate=validators.Integer(minimum=1), default=1000)
+
+    write_concurrency = Option(
+        doc='''
+        **Syntax:** **write_concurrency=***<int>*
+        **Description:** number of concurrent requests used to save the documents to the KV store. Defaults to 2''',
+        require=False, validate=validators.Integer(minimum=1), default=2)
+
+    workers = Option(
+        doc='''
+        **Syntax:** **workers=***<int>*
+        **Description:** number of processes calculating the statistics of the values and fields in parallel. Defaults to 1, the statistics are calculated by the search process''',
+        require=False, validate=validators.Integer(minimum=1), default=1)
+
+    max_memory = Option(
+        doc='''
+        **Syntax:** **max_memory=***<size>*
+        **Description:** estimated memory the collected values may use, e.g. 2GB (units B, KB, MB, GB and TB, default MB). If it is exceeded, the events are partitioned by a hash of their value into temporary files in the dispatch directory, which are processed one after the other. Not set by default, all values are kept in memory''',
+        require=False, validate=custom_validators.Size())
+
+
+    def summarized(self):
+        """ True if the values are collected in bounded memory summaries instead of arrays of every value """
+        return bool(self.sketch or self.decay)
+
+    def new_data(self):
+        """ Return an empty collection for the values of a value and field: a summary or an array of doubles, which
+        needs 8 bytes per value.
+        """
+        if self.decay:
+            return sketches.DecayedSummary(self.decay, self.compression)
+        if self.sketch:
+            return sketches.Summary(self.compression)
+        return array('d')
+
+    def data_bytes(self):
+        """ Estimated memory of a new collection of values """
+        if self.summarized():
+            return collection_bytes + summary_bytes_per_compression * self.compression
+        return collection_bytes
+
+    def group(self, records):
+        """ Collect the numeric values of every field by value. Records may also be partial aggregates produced by map.
+        If season is set, the values of a field are collected in a list with one collection per slot.
+        """
         dict = {}
-        for record in records:
-            if not record[self.value] in dict:
-                dict[record[self.value]] = {}
-            for fieldname in self.fieldnames:
-                value = convertStr(record[fieldname])
-                if value is None:
-                    continue # skip none nummeric values
-                try:
-                    new_data = dict[record[self.value]][fieldname]
-                except KeyError:
-                    new_data = []
+        for record, values in self.parsed(records):
+            self.add(dict, record, values)
+        return dict
+
+    def parsed(self, records):
+        """ Yields every record with the numeric values of its fields, None for non numeric values. The fields of
+        parse_chunk_size records are converted column by column. Partial aggregates are yielded without values.
+        """
+        for chunk in chunks(records, parse_chunk_size):
+            field_records = [record for record in chunk if not "hyperbaseline_partial" in record]
+            columns = [convert_column([record[fieldname] for record in field_records]) for fieldname in self.fieldnames]
+            rows = izip(*columns) if columns else repeat(())
+            for record in chunk:
+                if "hyperbaseline_partial" in record:
+                    yield record, None
+                else:
+                    yield record, next(rows)
+
+    def add(self, dict, record, values=None):
+        """ Add the values of a record to the values collected in dict. values are the converted values of the fields,
+        they are converted here if not given. Returns the estimated memory added.
+        """
+        if "hyperbaseline_partial" in record:
+            partial = json.loads(record["hyperbaseline_partial"])
+            added = 0 if partial["value"] in dict else value_bytes
+            self.merge_partial(dict, partial)
+            for state in partial["slots"] if self.season else [partial]:
+                if state is not None:
+                    added += self.data_bytes()
+                    if "counts" in state:
+                        added += array_value_bytes * sum(state["counts"])
+            return added
+        added = 0
+        if not record[self.value] in dict:
+            dict[record[self.value]] = {}
+            added += value_bytes
+        if self.decay or self.season:
+            timestamp = convertStr(record.get("_time", "")) or time.time()
+        if self.season:
+            slot = seasons.slot(self.season, seasons.hour_of_week(timestamp))
+        if values is None:
+            values = [convertStr(record[fieldname]) for fieldname in self.fieldnames]
+        for fieldname, value in izip(self.fieldnames, values):
+            if value is None:
+                continue # skip none nummeric values
+            try:
+                new_data = dict[record[self.value]][fieldname]
+            except KeyError:
+                new_data = [None] * seasons.slot_counts[self.season] if self.season else self.new_data()
+                added += collection_bytes if self.season else self.data_bytes()
+            dict[record[self.value]][fieldname] = new_data
+            if self.season:
+                if new_data[slot] is None:
+                    new_data[slot] = self.new_data()
+                    added += self.data_bytes()
+                new_data = new_data[slot]
+            if self.decay:
+                new_data.append(value, timestamp)
+            else:
                 new_data.append(value)
-                dict[record[self.value]][fieldname] = new_data
+                if not self.sketch:
+                    added += array_value_bytes
+        return added
+
+    def spill_directory(self):
+        """ Return the dispatch directory of the search, the temporary directory if the search provides no info path """
+        try:
+            return os.path.dirname(self.input_header["infoPath"])
+        except KeyError:
+            return tempfile.gettempdir()
+
+    def grouped(self, records, depth=0):
+        """ Yields the values collected by group, in one part per partition if they exceed max_memory. Once the
+        estimated memory exceeds max_memory, the collected values are written to partitions in the dispatch directory
+        as partial aggregates, followed by the remaining records. Every partition is grouped the same way, a partition
+        exceeding max_memory is split again with a different hash.
+        """
+        dict = {}
+        size = 0
+        max_memory = self.max_memory
+        spill = None
+        fieldnames = [self.value, "_time"] + self.fieldnames
+        try:
+            for record, values in self.parsed(records):
+                if spill is not None:
+                    if "hyperbaseline_partial" in record:
+                        spill.write(json.loads(record["hyperbaseline_partial"])["value"], record)
+                    else:
+                        spill.write(record[self.value], OrderedDict((k, record[k]) for k in fieldnames if k in record))
+                    continue
+                size += self.add(dict, record, values)
+                if max_memory and size > max_memory:
+                    if depth >= max_partition_depth:
+                        self.logger.warning("max_memory exceeded by a partition split %d times, grouping it in memory", depth)
+                        max_memory = None
+                        continue
+                    spill = partitions.Partitions(self.spill_directory(), partition_count, depth)
+                    self.logger.info("max_memory of %d bytes exceeded, spilling to %d partitions in %s", max_memory, partition_count, spill.directory)
+                    for key, partial in self.partials(dict):
+                        spill.write(key, partial)
+                    dict = size = None
+            if spill is None:
+                yield dict
+                return
+            self.logger.info("Spilled %d records", spill.records)
+            for partition_records in spill.read():
+                for partition_dict in self.grouped(partition_records, depth + 1):
+                    yield partition_dict
+        finally:
+            if spill is not None:
+                spill.remove()
+
+    def merge_state(self, data, state):
+        """ Add the values of a state returned by state to the values collected in data, which may be None. Returns
+        the merged collection.
+        """
+        if self.summarized():
+            summary = (sketches.DecayedSummary if self.decay else sketches.Summary).from_json(state["summary"])
+            if data is None:
+                return summary
+            data.merge(summary)
+            return data
+        if data is None:
+            data = self.new_data()
+        for value, count in zip(state["values"], state["counts"]):
+            data.extend([value] * count)
+        return data
+
+    def merge_partial(self, dict, partial):
+        """ Add a partial aggregate produced by map to the values collected by group. """
+        if not partial["value"] in dict:
+            dict[partial["value"]] = {}
+        data = dict[partial["value"]]
+        fieldname = partial["field"]
+        if self.season:
+            slots = data.setdefault(fieldname, [None] * seasons.slot_counts[self.season])
+            for slot, state in enumerate(partial["slots"]):
+                if state is not None:
+                    slots[slot] = self.merge_state(slots[slot], state)
+        else:
+            data[fieldname] = self.merge_state(data.get(fieldname), partial)
+
+    def state(self, data):
+        """ Return the mergeable state of the values collected for a value and field: the sketch if sketch is true or
+        decay is set, otherwise the distinct values and their counts. If season is set, the states of the slots are
+        returned in a list.
+        """
+        if not self.season:
+            return self.state_of(data)
+        state = OrderedDict()
+        state["season"] = self.season
+        state["slots"] = [self.state_of(slot_data) if slot_data is not None else None for slot_data in data]
+        return state
+
+    def state_of(self, data):
+        """ Return the mergeable state of a single collection of values """
+        state = OrderedDict()
+        if self.summarized():
+            state["summary"] = data.to_json()
+        else:
+            counts = {}
+            for x in data:
+                counts[x] = counts.get(x, 0) + 1
+            state["values"] = counts.keys()
+            state["counts"] = counts.values()
+        return state
 
-        output_array = []
+    def mergeable(self, state):
+        """ True if a stored state was collected the same way as the values of this run """
+        if state is None or state.get("season") != self.season:
+            return False
+        for slot_state in state["slots"] if self.season else [state]:
+            if slot_state is None:
+                continue
+            if ("summary" in slot_state) != self.summarized():
+                return False
+            if slot_state.get("summary", {}).get("half_life") != (float(self.decay) if self.decay else None):
+                return False
+        return True
+
+    def stored_value(self, dict, document):
+        """ Return the value of a stored document as it is used as key of dict. Stored values are unicode, the values
+        of the events are utf-8 encoded.
+        """
+        value = document["value"]
+        if value not in dict and isinstance(value, unicode):
+            value = value.encode("utf-8")
+        return value
+
+    def untouched_fields(self, dict, stored_documents):
+        """ Return the stored field documents without new data of the stored documents of the value layout by value.
+        A document of the value layout is written as a whole, so it has to keep these fields.
+        """
+        untouched = {}
+        for stored_document in stored_documents:
+            if "fields" not in stored_document:
+                continue # documents of the field layout aren't written again
+            value = self.stored_value(dict, stored_document)
+            for document in baseline_store.expand(stored_document):
+                if not document["field"] in dict.get(value, {}):
+                    untouched.setdefault(value, []).append(document)
+        return untouched
+
+    def merge_stored_state(self, dict, stored_documents):
+        """ Add the state stored by previous runs with mode=merge to the values and fields collected by group. """
+        for stored_document in stored_documents:
+            value = self.stored_value(dict, stored_document)
+            for document in baseline_store.expand(stored_document):
+                if not document["field"] in dict.get(value, {}):
+                    continue # no new data, the stored statistics stay as they are
+                state = document.get("state")
+                if not self.mergeable(state):
+                    self.logger.warning("No mergeable state stored for %s, replacing its statistics", document["_key"])
+                    continue
+                partial = OrderedDict(state)
+                partial["value"] = value
+                partial["field"] = document["field"]
+                self.merge_partial(dict, partial)
+
+    def map(self, records):
+        """ Pre-aggregate the records where they are searched, e.g. on the indexers. One record with a partial aggregate
+        is emitted per value and field: the sketch if sketch is true or decay is set, otherwise the distinct values and
+        their counts.
+        """
+        for key, partial in self.partials(self.group(records)):
+            yield partial
+
+    def partials(self, dict):
+        """ Yields the value and a record with the partial aggregate of every value and field collected in dict """
         for key, value in dict.iteritems():
             for k, v in value.iteritems():
-                sorted_data = sorted(v)
-                current_payload = OrderedDict()
-                current_payload["_key"] = self.config_name + "#" + key + "#" + k
-                current_payload["config_name"] = self.config_name
-                current_payload["value"] =  key
-                current_payload["field"] = k
-                current_payload["min"] = min(sorted_data)
-                current_payload["pct25"] = percentile(sorted_data,percent=0.25)
-                current_payload["mean"] = mean(sorted_data)
-                current_payload["median"] = median(sorted_data)
-                current_payload["pct75"] = percentile(sorted_data,percent=0.75)
-                current_payload["max"] = max(sorted_data)
-                current_payload["stdev"] = pstdev(sorted_data)
-                current_payload["mad"] = median(sorted([abs(x - current_payload["median"]) for x in sorted_data]))
-                current_payload["medcouple"] = medcouple.medcouple_1d(sorted_data)
-                current_payload["owner"] = user_id
-                current_payload["_time"] = int(time.time())
-                output_array.append(current_payload)
-                yield current_payload
-
-        # check if the output_array actually contains elements before pushing it into the KV store
-        if output_array:
-            app_service = client.Service(token=self.input_header["sessionKey"])
-            request2 = app_service.request(
-                self.collections_data_endpoint + self.kv_store + "/batch_save",
-                method = 'post',
-                headers = [('content-type', 'application/json')],
-                body = json.dumps(output_array),
-                owner = 'nobody',
-                app = 'SA-hyperbaseline'
-            )
+                partial = OrderedDict()
+                partial["value"] = key
+                partial["field"] = k
+                partial.update(self.state(v))
+                yield key, {"hyperbaseline_partial": json.dumps(partial)}
+
+    def statistics(self, data):
+        """ Calculate the statistics of the values collected for a value and field (or a slot) """
+        if self.summarized():
+            return data.statistics(self.medcouple_sample)
+        stats = OrderedDict()
+        # the order of the values doesn't matter, all order statistics are taken from this single sort
+        sorted_data = data
+        sort_values(sorted_data)
+        stats["min"] = sorted_data[0]
+        stats["pct25"] = percentile(sorted_data,percent=0.25)
+        stats["mean"] = mean(sorted_data)
+        stats["median"] = median(sorted_data)
+        stats["pct75"] = percentile(sorted_data,percent=0.75)
+        stats["max"] = sorted_data[-1]
+        stats["stdev"] = pstdev(sorted_data)
+        stats["mad"] = median_absolute_deviation(sorted_data, stats["median"])
+        if self.medcouple_sample:
+            sample = order_statistics(sorted_data, self.medcouple_sample)
+            stats["medcouple"] = medcouple.medcouple_1d(sample, presorted=True)
+            stats["medcouple_sample"] = len(sample)
+        else:
+            stats["medcouple"] = medcouple.medcouple_1d(sorted_data, presorted=True)
+        return stats
+
+    def combine(self, slots):
+        """ Collect the values of all slots in a single collection """
+        combined = None
+        for slot_data in slots:
+            if slot_data is not None:
+                # merging modifies the summaries, the slots are merged through their state
+                combined = self.merge_state(combined, self.state_of(slot_data))
+        return combined
+
+    def payload(self, key, field, data):
+        """ Return the document with the statistics of the values collected for a value and field """
+        current_payload = OrderedDict()
+        current_payload["_key"] = self.config_name + "#" + key + "#" + field
+        current_payload["config_name"] = self.config_name
+        current_payload["value"] =  key
+        current_payload["field"] = field
+        # the statistics of all slots are stored as well, e.g. for records without _time
+        current_payload.update(self.statistics(self.combine(data) if self.season else data))
+        if self.bounds or self.thresholds:
+            current_payload["bounds"] = outlier_bounds.compute_all_bounds(current_payload, self.thresholds or [])
+        if self.season:
+            slot_stats = []
+            for slot_data in data:
+                stats = None
+                if slot_data is not None:
+                    stats = self.statistics(slot_data)
+                    if self.bounds or self.thresholds:
+                        stats["bounds"] = outlier_bounds.compute_all_bounds(stats, self.thresholds or [])
+                slot_stats.append(stats)
+            current_payload["season"] = self.season
+            current_payload["slots"] = seasons.pack(slot_stats)
+        if self.mode == "merge":
+            current_payload["state"] = self.state(data)
+        return current_payload
+
+    def cost(self, data):
+        """ Estimate the time needed for the statistics of the values collected for a value and field by their number.
+        Summaries are bounded in size and count as a constant.
+        """
+        slots = [slot_data for slot_data in data if slot_data is not None] if self.season else [data]
+        cost = sum(len(slot_data) if isinstance(slot_data, array) else self.compression for slot_data in slots)
+        # the statistics of the combined slots are calculated as well
+        return 2 * cost if self.season else cost
+
+    def balanced_batches(self, dict, batch_count):
+        """ Split the value and field pairs into batch_count batches of about the same cost, largest first. """
+        items = sorted(((self.cost(v), key, k) for key, value in dict.iteritems() for k, v in value.iteritems()), reverse=True)
+        batches = [(0, i, []) for i in xrange(min(batch_count, len(items)))]
+        for cost, key, k in items:
+            batch_cost, i, batch = heapq.heappop(batches)
+            batch.append((key, k))
+            heapq.heappush(batches, (batch_cost + cost, i, batch))
+        return [heap_entry[2] for heap_entry in batches]
+
+    def parallel_payloads(self, dict):
+        """ Calculate the documents of all values and fields in a pool of worker processes. The workers are forked
+        after the values are collected and read them from their copy of the memory of this process, only the keys and
+        the documents are sent between the processes. Returns the documents by value and field.
+        """
+        global _command, _groups
+        _command, _groups = self, dict
+        payloads = {}
+        pool = multiprocessing.Pool(self.workers)
+        try:
+            # more batches than workers, so that a worker finished early takes the next one
+            for batch_payloads in pool.imap_unordered(_batch_payloads, self.balanced_batches(dict, 4 * self.workers)):
+                for key, k, current_payload in batch_payloads:
+                    payloads[(key, k)] = current_payload
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            _command = _groups = None
+        return payloads
+
+    def reduce(self, records):
+        xml_doc = minidom.parseString(self.input_header["authString"])
+        user_id = xml_doc.getElementsByTagName('userId')[0].firstChild.nodeValue
+        app_service = client.Service(handler=binding.pooled_handler(), token=self.input_header["sessionKey"])
+        documents = batches = 0
+        seconds = 0.0
+        # a single part unless max_memory is exceeded
+        for dict in self.grouped(records):
+            stored_documents = []
+            if self.mode == "merge" or self.layout == "value":
+                stored_documents = list(baseline_store.query_baselines(app_service, self.kv_store, self.config_name, dict.keys()))
+            if self.mode == "merge":
+                self.merge_stored_state(dict, stored_documents)
+            untouched = self.untouched_fields(dict, stored_documents)
+
+            payloads = None
+            if self.workers > 1:
+                if hasattr(os, "fork"):
+                    start = time.time()
+                    payloads = self.parallel_payloads(dict)
+                    self.logger.info("Calculated the statistics of %d fields with %d workers in %.2fs", len(payloads), self.workers, time.time() - start)
+                else:
+                    self.logger.warning("workers=%d needs fork, calculating the statistics in the search process", self.workers)
+
+            # the threads of a writer must not run while the workers of the next part are forked, a thread may hold
+            # a lock that would stay locked in the forked process
+            writer = baseline_store.BatchWriter(app_service, self.kv_store, self.batch_size, self.write_concurrency)
+            for key, value in dict.iteritems():
+                value_documents = []
+                for k, v in value.iteritems():
+                    if payloads is not None:
+                        current_payload = payloads.pop((key, k))
+                    else:
+                        current_payload = self.payload(key, k, v)
+                    current_payload["owner"] = user_id
+                    current_payload["_time"] = int(time.time())
+                    if self.layout == "value":
+                        value_documents.append(current_payload)
+                    else:
+                        writer.write(current_payload)
+                    yield current_payload
+                if value_documents:
+                    writer.write(baseline_store.consolidate(value_documents + untouched.get(key, [])))
+            writer.close()
+            documents += writer.documents
+            batches += writer.batches
+            seconds += writer.seconds
+
+        self.logger.info("Saved %d documents in %d batches in %.2fs (%.0f documents/s)", documents, batches, seconds, documents / seconds if seconds else 0.0)
+
+# the command and the collected values read by the worker processes of parallel_payloads
+_command = None
+_groups = None
+
+def _batch_payloads(batch):
+    """ Calculate the documents of a batch of value and field pairs in a worker process """
+    return [(key, k, _command.payload(key, k, _groups[key][k])) for key, k in batch]
 
 dispatch(FillBaselineCommand, sys.argv, sys.stdin, sys.stdout, __name__)
@@ -25,49 +25,56 @@ import random
 
 from itertools import tee, izip
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# below this number of values the overhead of numpy outweighs the vectorized kernel
+numpy_threshold = 100
+
 def wmedian(A, W):
     """This computes the weighted median of array A with corresponding
-    weights W.
+    weights W, i.e. the smallest a in A such that the elements of A
+    up to a hold at least half of the total weight.
+
+    Quickselect with random pivots: every round only keeps the side
+    of the pivot holding the median, so the expected running time is
+    linear in len(A) instead of sorting A.
     """
 
     AW = zip(A, W)
-    n = len(AW)
 
     wtot = sum(W)
-
-    beg = 0
-    end = n - 1
+    # weight of the elements below the remaining candidates
+    wbelow = 0
 
     while True:
-        mid = (beg + end)//2
+        trial = random.choice(AW)[0]
 
-        AW = sorted(AW, key = lambda x: x[0]) # A partial sort would suffice here
+        smaller = [(a, w) for (a, w) in AW if a < trial]
+        wleft = wbelow + sum(w for (a, w) in smaller)
+        if 2*wleft >= wtot:
+            AW = smaller
+            continue
 
-        trial = AW[mid][0]
-
-        wleft = wright = 0
-        for (a, w) in AW:
-            if a < trial:
-                wleft += w
-            else:
-                # This also includes a == trial, i.e. the "middle"
-                # weight.
-                wright += w
-
-        if 2*wleft > wtot:
-            end = mid
-        elif 2*wright < wtot:
-            beg = mid
-        else:
+        wmiddle = sum(w for (a, w) in AW if a == trial)
+        if 2*(wleft + wmiddle) >= wtot:
             return trial
 
+        wbelow = wleft + wmiddle
+        AW = [(a, w) for (a, w) in AW if a > trial]
+
 
-def medcouple_1d(X, eps1 = 2**-52, eps2 = 2**-1022):
+def medcouple_1d(X, eps1 = 2**-52, eps2 = 2**-1022, presorted = False):
     """Calculates the medcouple robust measure of skewness.
 
     Parameters
     ----------
     y : array-like, 1-d
+    presorted : bool
+        True if y is sorted in ascending order already, which saves
+        sorting it
 
     Returns
     -------
@@ -91,7 +98,11 @@ def medcouple_1d(X, eps1 = 2**-52, eps2 = 2**-1022):
     if n < 3:
         return 0
 
-    Z = sorted(X, reverse=True)
+    # as floats, integer division would break the scaling below
+    if presorted:
+        Z = [float(x) for x in reversed(X)]
+    else:
+        Z = sorted((float(x) for x in X), reverse=True)
 
     if n % 2 == 1:
         Zmed = Z[n2]
@@ -118,6 +129,15 @@ def medcouple_1d(X, eps1 = 2**-52, eps2 = 2**-1022):
     Zplus   = [z for z in Z if z >= -Zeps]
     Zminus  = [z for z in Z if Zeps >= z]
 
+    if numpy is not None and n >= numpy_threshold:
+        return _kth_pair_numpy(Zplus, Zminus, eps1, eps2)
+    return _kth_pair(Zplus, Zminus, eps1, eps2)
+
+
+def _kth_pair(Zplus, Zminus, eps1, eps2):
+    """Selects the medcouple among the kernel values of Zplus and
+    Zminus with the kth pair algorithm of Johnson & Mizoguchi.
+    """
     n_plus = len(Zplus)
     n_minus = len(Zminus)
 
@@ -193,7 +213,7 @@ def medcouple_1d(X, eps1 = 2**-52, eps2 = 2**-1022):
                 L = Q
                 Ltot = sumQ
             else:
-                return Am
+                return float(Am)
 
     # Didn't find the median, but now we have a very small search
     # space to find it in, just between the left and right boundaries.
@@ -208,7 +228,123 @@ def medcouple_1d(X, eps1 = 2**-52, eps2 = 2**-1022):
 
     Am = A[medc_idx - Ltot]
 
-    return Am
+    return float(Am)
+
+
+def _kth_pair_numpy(Zplus, Zminus, eps1, eps2):
+    """Same as _kth_pair with NumPy. The kernel is evaluated on arrays
+    of index pairs and the boundaries P and Q are found with a binary
+    search over every row at once instead of scanning the rows
+    element by element. The kernel values are calculated exactly like
+    in _kth_pair, so the result is identical.
+    """
+
+    Zplus = numpy.array(Zplus, dtype=numpy.float64)
+    Zminus = numpy.array(Zminus, dtype=numpy.float64)
+
+    n_plus = len(Zplus)
+    n_minus = len(Zminus)
+
+    def h_kern(i, j):
+        """Kernel function h for arrays of row indices i and column
+        indices j.
+        """
+        a = Zplus[i]
+        b = Zminus[j]
+
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            h = (a + b)/(a - b)
+        ties = numpy.abs(a - b) <= 2*eps2
+        if ties.any():
+            h = numpy.where(ties, numpy.sign(n_plus - 1 - i - j), h)
+
+        return h
+
+    def row_search(condition, low, high):
+        """Index of the first column of every row for which condition
+        doesn't hold. The kernel decreases along a row, so condition
+        holds on a prefix of the row. The search starts between low
+        and high, rows whose boundary lies outside are searched
+        completely.
+        """
+        low = numpy.minimum(low, n_minus)
+        high = numpy.maximum(high, low)
+        check = numpy.flatnonzero(low > 0)
+        low[check[~condition(check, low[check] - 1)]] = 0
+        check = numpy.flatnonzero(high < n_minus)
+        high[check[condition(check, high[check])]] = n_minus
+        # bisect the rows which aren't done yet on compacted arrays
+        active = numpy.flatnonzero(low < high)
+        active_low = low[active]
+        active_high = high[active]
+        while len(active):
+            mid = (active_low + active_high)//2
+            holds = condition(active, mid)
+            active_low = numpy.where(holds, mid + 1, active_low)
+            active_high = numpy.where(holds, active_high, mid)
+            searching = active_low < active_high
+            if not searching.all():
+                low[active[~searching]] = active_low[~searching]
+                active = active[searching]
+                active_low = active_low[searching]
+                active_high = active_high[searching]
+        return low
+
+    # Init left and right borders
+    L = numpy.zeros(n_plus, dtype=numpy.intp)
+    R = numpy.full(n_plus, n_minus - 1, dtype=numpy.intp)
+
+    Ltot = 0
+    Rtot = n_minus*n_plus
+    medc_idx = Rtot//2
+
+    # kth pair algorithm (Johnson & Mizoguchi)
+    while Rtot - Ltot > n_plus:
+
+        # First, compute the weighted median inside the given bounds
+        I = numpy.flatnonzero(L <= R)
+        A = h_kern(I, (L[I] + R[I])//2)
+        W = R[I] - L[I] + 1
+        order = numpy.argsort(A, kind='mergesort')
+        cumulative = numpy.cumsum(W[order])
+        Am = float(A[order[numpy.searchsorted(2*cumulative, cumulative[-1])]])
+
+        Am_eps = eps1*(eps1 + abs(Am))
+
+        # Compute new left and right boundaries, based on the weighted
+        # median. They lie between the current boundaries, unless the
+        # kernel isn't monotone within epsilon. The scans of _kth_pair
+        # carry the column over to the next row, which the accumulated
+        # maximum and minimum do here.
+        P = numpy.maximum.accumulate(row_search(
+            lambda i, j: h_kern(i, j) - Am > Am_eps, L, R + 1)[::-1])[::-1] - 1
+        Q = numpy.minimum.accumulate(row_search(
+            lambda i, j: ~(h_kern(i, j) - Am < -Am_eps), L, R + 1))
+
+        # Check on which side of those bounds the desired median of
+        # the whole matrix may be.
+        sumP = int(P.sum()) + len(P)
+        sumQ = int(Q.sum())
+
+        if medc_idx <= sumP - 1:
+            R = P
+            Rtot = sumP
+        else:
+            if medc_idx > sumQ - 1:
+                L = Q
+                Ltot = sumQ
+            else:
+                return float(Am)
+
+    # Didn't find the median, but now we have a very small search
+    # space to find it in, just between the left and right boundaries.
+    counts = numpy.maximum(R - L + 1, 0)
+    I = numpy.repeat(numpy.arange(n_plus), counts)
+    J = L[I] + numpy.arange(len(I)) - (numpy.cumsum(counts) - counts)[I]
+
+    A = numpy.sort(h_kern(I, J))[::-1]
+
+    return float(A[medc_idx - Ltot])
 
 
 def signum(x):
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# encoding=utf8
+
+import sys
+import splunklib.client as client
+import splunklib.binding as binding
+import baseline_store
+
+from collections import OrderedDict
+from splunklib.searchcommands import \
+    dispatch, GeneratingCommand, Configuration, Option, validators
+
+@Configuration()
+class MigrateBaselineCommand(GeneratingCommand):
+    """ Rewrites the baselines of a config_name stored by fillbaseline in the given layout.
+    ##Syntax
+    .. code-block::
+        migratebaseline config_name=<string> [kv_store=<string>] [layout=field|value] [batch_size=<int>]
+    ##Description:
+        The field layout stores one document per value and field (key config_name#value#field), the value layout one
+        document per value holding the statistics of every field (key config_name#value). The documents are saved in the
+        new layout before the documents of the old layout are deleted. One record is returned per saved document.
+    ##Example
+    ..code-block::
+        | migratebaseline config_name="ui_usage" layout=value
+    """
+    config_name = Option(
+        doc='''
+        **Syntax:** **config_name=***<string>*
+        **Description:** Name of the baselines to migrate''',
+        require=True)
+
+    kv_store = Option(
+        doc='''
+        **Syntax:** **kv_store=***<string>*
+        **Description:** name of the collection the statistics are stored in''',
+        require=False, default="hyperbaseline")
+
+    layout = Option(
+        doc='''
+        **Syntax:** **layout=***field|value*
+        **Description:** layout the baselines are rewritten in. Defaults to value''',
+        require=False, validate=validators.Set("field", "value"), default="value")
+
+    batch_size = Option(
+        doc='''
+        **Syntax:** **batch_size=***<int>*
+        **Description:** number of documents saved to the KV store per request. Defaults to 1000''',
+        require=False, validate=validators.Integer(minimum=1), default=1000)
+
+    def generate(self):
+        app_service = client.Service(handler=binding.pooled_handler(), token=self.input_header["sessionKey"])
+        # value -> field -> baseline, the newest baseline wins if a field is stored in both layouts
+        by_value = OrderedDict()
+        # keys of the documents stored in the other layout
+        old_keys = []
+        migrated_values = set()
+        for document in baseline_store.query_baselines(app_service, self.kv_store, self.config_name):
+            if ("fields" in document) != (self.layout == "value"):
+                old_keys.append(document["_key"])
+                migrated_values.add(document["value"])
+            for baseline in baseline_store.expand(document):
+                baselines = by_value.setdefault(baseline["value"], OrderedDict())
+                if baseline["field"] not in baselines or baselines[baseline["field"]].get("_time") < baseline.get("_time"):
+                    baselines[baseline["field"]] = baseline
+
+        writer = baseline_store.BatchWriter(app_service, self.kv_store, self.batch_size)
+        for value, baselines in by_value.iteritems():
+            if value not in migrated_values:
+                continue
+            baselines = baselines.values()
+            documents = [baseline_store.consolidate(baselines)] if self.layout == "value" else baselines
+            for document in documents:
+                writer.write(document)
+                yield {"_key": document["_key"], "config_name": self.config_name, "value": value, "layout": self.layout}
+        writer.close()
+        # the new documents have other keys, only the documents of the old layout are deleted
+        baseline_store.delete_documents(app_service, self.kv_store, old_keys)
+        self.logger.info("Migrated %d documents to %d documents of the %s layout", len(old_keys), writer.documents, self.layout)
+
+dispatch(MigrateBaselineCommand, sys.argv, sys.stdin, sys.stdout, __name__)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# encoding=utf8
+
+import math
+
+from collections import OrderedDict
+
+# thresholds used by compute_bounds if no threshold is given
+default_thresholds = OrderedDict([("ESD", 3), ("Hampel", 3), ("SBR", 1.5), ("ASBR", 1.5)])
+
+# statistics compute_bounds reads for each method
+method_statistics = {
+    "ESD": ("mean", "stdev"),
+    "Hampel": ("median", "mad"),
+    "SBR": ("pct25", "pct75"),
+    "ASBR": ("pct25", "pct75", "medcouple")
+}
+
+def compute_bounds(stats, method, threshold=None):
+    """ Calculate the lower and upper bound of the given outlier detection method from the statistics of a baseline.
+    The default threshold of the method is used if threshold is None.
+    """
+    if method == "ESD":
+        # set default threshold if option is empty
+        t = threshold or 3
+        #extreme Studentized deviation bounds are [mean - t * SD, mean + t * SD]
+        lower_bound = stats["mean"] - t * stats["stdev"]
+        upper_bound = stats["mean"] + t * stats["stdev"]
+    elif method == "Hampel":
+        # set default threshold if option is empty
+        t = threshold or 3
+        # Hampel bounds are [median - t * MAD, median + t * MAD]
+        lower_bound = stats["median"] - t * stats["mad"]
+        upper_bound = stats["median"] + t * stats["mad"]
+    elif method == "SBR":
+        # set default threshold if option is empty
+        c = threshold or 1.5
+        # standard boxplot rule bounds are [Q1 - c * IQD, Q3 + c * IQD]
+        # calculate the IQD (inter quartile distance)
+        iqd = stats["pct75"] - stats["pct25"]
+        lower_bound = stats["pct25"] - c * iqd
+        upper_bound = stats["pct75"] + c * iqd
+    elif method == "ASBR":
+        # set default threshold if option is empty
+        c = threshold or 1.5
+        a = -4
+        b = 3
+        mc = float(stats["medcouple"])
+        # asymmetric standard boxplot rule bounds for positive MC are [Q1 – c * exp(a * MC) * IQD, Q3 + c * exp(b * MC) * IQD ]
+        # asymmetric standard boxplot rule bounds for negative MC are [Q1 – c * exp(-b * MC) * IQD, Q3 + c * exp(-a * MC) * IQD ]
+        # calculate the IQD (inter quartile distance)
+        iqd = stats["pct75"] - stats["pct25"]
+        if mc >= 0:
+            lower_adjustment_factor = c * math.exp(a * mc) * iqd
+            upper_adjustment_factor = c * math.exp(b * mc) * iqd
+        else:
+            lower_adjustment_factor = c * math.exp(-b * mc) * iqd
+            upper_adjustment_factor = c * math.exp(-a * mc) * iqd
+        lower_bound = stats["pct25"] - lower_adjustment_factor
+        upper_bound = stats["pct75"] + upper_adjustment_factor
+    # combine lower and upper bound into a list
+    return [lower_bound, upper_bound]
+
+def threshold_key(threshold):
+    """ Format a threshold as key of the bounds stored by fillbaseline, e.g. 3 and 3.0 both become "3". Thresholds
+    which "%g" would round keep all their digits, so that e.g. 3.0000001 doesn't get the key of 3.
+    """
+    key = "%g" % threshold
+    if float(key) != threshold:
+        key = repr(float(threshold))
+    return key
+
+def compute_all_bounds(stats, thresholds=()):
+    """ Calculate the bounds of every method for its default threshold and the given thresholds. The result maps
+    method -> threshold key -> [lower, upper]. Methods whose statistics are missing, e.g. no stdev for a single data
+    point, are left out.
+    """
+    all_bounds = OrderedDict()
+    for method, default_threshold in default_thresholds.iteritems():
+        method_bounds = OrderedDict()
+        for threshold in [default_threshold] + list(thresholds):
+            try:
+                method_bounds[threshold_key(threshold)] = compute_bounds(stats, method, threshold)
+            except TypeError:
+                break
+        if method_bounds:
+            all_bounds[method] = method_bounds
+    return all_bounds
+
+def stored_bounds(stats, method, threshold=None):
+    """ Return the bounds for method and threshold stored with the statistics by fillbaseline or None. """
+    try:
+        return stats["bounds"][method][threshold_key(threshold or default_thresholds[method])]
+    except (KeyError, TypeError):
+        return None
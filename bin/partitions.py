@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# encoding=utf8
+
+import hashlib
+import json
+import os
+import shutil
+import struct
+import tempfile
+
+class Partitions(object):
+    """ Temporary run files in a directory, which records are partitioned into by a hash of their value, so that every
+    value ends up in the same partition. The partitions are read back one after the other and removed afterwards.
+    """
+
+    def __init__(self, directory, count=16, seed=0):
+        self.directory = tempfile.mkdtemp(prefix="hyperbaseline_partitions_", dir=directory)
+        self.count = count
+        self.seed = seed
+        self.records = 0
+        self._files = [None] * count
+
+    def partition(self, value):
+        """ Return the partition of a value. The seed changes the hash, so that a partition can be split again. """
+        if isinstance(value, unicode):
+            value = value.encode("utf-8")
+        # a crc is linear, values sharing a partition would share it again with any other seed
+        digest = hashlib.md5("%d#%s" % (self.seed, value)).digest()
+        return struct.unpack_from("<I", digest)[0] % self.count
+
+    def path(self, i):
+        return os.path.join(self.directory, "%03d.json" % i)
+
+    def write(self, value, record):
+        """ Append a record to the partition of its value """
+        i = self.partition(value)
+        if self._files[i] is None:
+            self._files[i] = open(self.path(i), "wb")
+        self._files[i].write(json.dumps(record) + "\n")
+        self.records += 1
+
+    def read(self):
+        """ Yields the records of every partition holding records as an iterator, a partition is removed once the
+        next one is requested.
+        """
+        self.close()
+        for i in xrange(self.count):
+            if self._files[i] is None:
+                continue
+            with open(self.path(i), "rb") as f:
+                yield (json.loads(line) for line in f)
+            os.remove(self.path(i))
+
+    def close(self):
+        for f in self._files:
+            if f is not None and not f.closed:
+                f.close()
+
+    def remove(self):
+        """ Remove the run files and their directory """
+        self.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
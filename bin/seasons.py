@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# encoding=utf8
+
+import time
+
+from collections import OrderedDict
+
+# number of slots of each season
+slot_counts = OrderedDict([("hour", 24), ("wday", 7), ("hour_of_week", 168)])
+
+# local hour of week of 15 minute buckets, every time zone offset is a multiple of 15 minutes
+_hours_of_week = {}
+
+def hour_of_week(timestamp):
+    """ Return the hour of the week of an epoch timestamp in local time, 0 is monday 0:00 to 0:59. """
+    bucket = int(float(timestamp)) // 900
+    try:
+        return _hours_of_week[bucket]
+    except KeyError:
+        if len(_hours_of_week) > 100000:
+            _hours_of_week.clear()
+        local_time = time.localtime(bucket * 900)
+        how = _hours_of_week[bucket] = local_time.tm_wday * 24 + local_time.tm_hour
+        return how
+
+def slot(season, how):
+    """ Return the slot of season for an hour of the week. """
+    if season == "hour":
+        return how % 24
+    if season == "wday":
+        return how // 24
+    return how
+
+def pack(slot_stats):
+    """ Pack a list with the statistics of every slot (None for slots without data) into one list per statistic.
+    Stored bounds are packed into one list per method and threshold.
+    """
+    n = len(slot_stats)
+    packed = OrderedDict()
+    for i, stats in enumerate(slot_stats):
+        if stats is None:
+            continue
+        for name, value in stats.iteritems():
+            if name == "bounds":
+                packed_bounds = packed.setdefault("bounds", OrderedDict())
+                for method, method_bounds in value.iteritems():
+                    for key, bounds in method_bounds.iteritems():
+                        packed_bounds.setdefault(method, OrderedDict()).setdefault(key, [None] * n)[i] = bounds
+            else:
+                packed.setdefault(name, [None] * n)[i] = value
+    return packed
+
+def unpack(packed, i):
+    """ Return the statistics of slot i packed by pack or None if the slot has no data. """
+    stats = {}
+    for name, values in packed.iteritems():
+        if name == "bounds":
+            stats["bounds"] = {}
+            for method, method_bounds in values.iteritems():
+                stats["bounds"][method] = {}
+                for key, bounds in method_bounds.iteritems():
+                    if bounds[i] is not None:
+                        stats["bounds"][method][key] = bounds[i]
+        else:
+            stats[name] = values[i]
+    # all statistics of a slot without data are None, the packed statistics may be a projection
+    if all(value is None for name, value in stats.iteritems() if name != "bounds"):
+        return None
+    return stats
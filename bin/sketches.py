@@ -0,0 +1,384 @@
+#!/usr/bin/env python
+# encoding=utf8
+
+import math
+import medcouple
+
+from collections import OrderedDict
+
+class Welford(object):
+    """ Running count, mean, sum of squared deviations, minimum and maximum of a stream of values using Welford's
+    algorithm. Accumulators of different parts of the stream can be merged.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, x, weight=1):
+        """ Add x, a weight other than 1 counts x weight times (West, 1979) """
+        self.count += weight
+        delta = x - self.mean
+        self.mean += delta * weight / self.count
+        self.m2 += weight * delta * (x - self.mean)
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+
+    def merge(self, other):
+        """ Add the values accumulated by other (Chan et al.) """
+        if not other.count:
+            return
+        if not self.count:
+            self.count, self.mean, self.m2, self.min, self.max = other.count, other.mean, other.m2, other.min, other.max
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def scale(self, factor):
+        """ Multiply the weight of every value added so far by factor """
+        self.count *= factor
+        self.m2 *= factor
+
+    def pstdev(self):
+        """ Population standard deviation, None for less than 2 values like fillbaseline.pstdev """
+        if self.count < 2:
+            return None
+        return (self.m2 / self.count)**0.5
+
+    def to_json(self):
+        return [self.count, self.mean, self.m2, self.min, self.max]
+
+    @classmethod
+    def from_json(cls, state):
+        accumulator = cls()
+        accumulator.count, accumulator.mean, accumulator.m2, accumulator.min, accumulator.max = state
+        return accumulator
+
+class TDigest(object):
+    """ Merging t-digest (Dunning & Ertl, "Computing Extremely Accurate Quantiles Using t-Digests") for quantile
+    estimates with bounded memory. Values are buffered and merged into at most about compression centroids. Centroids
+    near the tails are kept small, so the estimates are most accurate for low and high quantiles. As long as no
+    centroid holds more than one value the quantiles are exact.
+    """
+
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.means = []
+        self.weights = []
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self._buffer = []
+
+    def add(self, x, weight=1.0):
+        self._buffer.append((x, weight))
+        self.total += weight
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+        if len(self._buffer) >= 5 * self.compression:
+            self._compress()
+
+    def merge(self, other):
+        """ Add the centroids of other """
+        other._compress()
+        for x, weight in zip(other.means, other.weights):
+            self.add(x, weight)
+        # the centroids of other don't carry its extremes
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def scale(self, factor):
+        """ Multiply the weight of every value added so far by factor. Centroids whose weight underflows are dropped. """
+        self._compress()
+        centroids = [(mean, weight * factor) for mean, weight in zip(self.means, self.weights) if weight * factor > 0]
+        self.means = [mean for mean, weight in centroids]
+        self.weights = [weight for mean, weight in centroids]
+        self.total = float(sum(self.weights))
+
+    def _scale(self, q):
+        # k1 scale function, a centroid may span at most one unit of k
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        # values whose weight underflowed carry no weight
+        points = sorted((x, w) for x, w in zip(self.means, self.weights) + self._buffer if w > 0)
+        self._buffer = []
+        total = self.total
+        if not points or total <= 0:
+            self.means = []
+            self.weights = []
+            return
+        means = []
+        weights = []
+        mean, weight = points[0]
+        weight_before = 0.0
+        k_lower = self._scale(0.0)
+        for x, w in points[1:]:
+            if self._scale((weight_before + weight + w) / total) - k_lower <= 1:
+                weight += w
+                mean += (x - mean) * w / weight
+            else:
+                means.append(mean)
+                weights.append(weight)
+                weight_before += weight
+                k_lower = self._scale(weight_before / total)
+                mean, weight = x, w
+        means.append(mean)
+        weights.append(weight)
+        self.means = means
+        self.weights = weights
+
+    def quantile(self, q):
+        """ Estimate the q quantile. The interpolation between the order statistics is the same as in
+        fillbaseline.percentile, so the result is exact if every centroid holds a single value.
+        """
+        self._compress()
+        if not self.means:
+            return None
+        if len(self.means) == 1:
+            return self.means[0]
+        # position in the weighted order statistics, centroid i is centred at its cumulative weight + weight / 2
+        target = q * (self.total - 1) + 0.5
+        cumulative = 0.0
+        previous_mid = None
+        previous_mean = None
+        for mean, weight in zip(self.means, self.weights):
+            mid = cumulative + weight / 2.0
+            if target <= mid:
+                if previous_mid is None:
+                    # below the centre of the first centroid, interpolate from the minimum
+                    if mid <= 0.5:
+                        return mean
+                    return self.min + (mean - self.min) * max(target - 0.5, 0.0) / (mid - 0.5)
+                return previous_mean + (mean - previous_mean) * (target - previous_mid) / (mid - previous_mid)
+            cumulative += weight
+            previous_mid, previous_mean = mid, mean
+        # above the centre of the last centroid, interpolate to the maximum
+        end = self.total - 0.5
+        if end <= previous_mid:
+            return previous_mean
+        return previous_mean + (self.max - previous_mean) * min(target - previous_mid, end - previous_mid) / (end - previous_mid)
+
+    def cdf(self, x):
+        """ Estimate the fraction of the values below x, the inverse of quantile. """
+        self._compress()
+        if not self.means:
+            return None
+        if x <= self.min:
+            return 0.0
+        if x >= self.max:
+            return 1.0
+        if len(self.means) == 1 or self.total <= 1:
+            return 0.5
+        # piecewise linear from (min, 0.5) over the centroid centres to (max, total - 0.5), like quantile
+        previous_position, previous_x = 0.5, self.min
+        cumulative = 0.0
+        position = None
+        for mean, weight in zip(self.means, self.weights) + [(self.max, None)]:
+            mid = cumulative + weight / 2.0 if weight is not None else self.total - 0.5
+            if x < mean:
+                if mean > previous_x:
+                    position = previous_position + (mid - previous_position) * (x - previous_x) / (mean - previous_x)
+                else:
+                    position = previous_position
+                break
+            cumulative += weight or 0.0
+            previous_position, previous_x = max(mid, previous_position), mean
+        if position is None:
+            position = previous_position
+        return min(max((position - 0.5) / (self.total - 1), 0.0), 1.0)
+
+    def centroids(self):
+        self._compress()
+        return zip(self.means, self.weights)
+
+    def is_exact(self):
+        """ True as long as every centroid holds a single value of weight 1 """
+        self._compress()
+        return all(weight == 1 for weight in self.weights)
+
+    def to_json(self):
+        self._compress()
+        return {"compression": self.compression, "means": self.means, "weights": self.weights, "min": self.min, "max": self.max}
+
+    @classmethod
+    def from_json(cls, state):
+        digest = cls(state["compression"])
+        digest.means = list(state["means"])
+        digest.weights = list(state["weights"])
+        digest.total = float(sum(digest.weights))
+        digest.min = state["min"]
+        digest.max = state["max"]
+        return digest
+
+class Summary(object):
+    """ Bounded memory replacement for the list of values of a (value, field) group in fillbaseline. pct25, median
+    and pct75 are estimated with a t-digest, min, max, mean and stdev are calculated exactly with Welford's algorithm.
+    mad and medcouple are calculated from the t-digest as well.
+    """
+
+    def __init__(self, compression=100):
+        self.moments = Welford()
+        self.digest = TDigest(compression)
+
+    def append(self, x):
+        self.moments.add(x)
+        self.digest.add(x)
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        self.digest.merge(other.digest)
+
+    def statistics(self, medcouple_sample=None):
+        """ Return the statistics in the order fillbaseline stores them. The medcouple is calculated on
+        medcouple_sample quantiles (default 4 * compression), which is stored as medcouple_sample if given.
+        """
+        stats = OrderedDict()
+        stats["min"] = self.moments.min
+        stats["pct25"] = self.digest.quantile(0.25)
+        stats["mean"] = self.moments.mean
+        stats["median"] = self.digest.quantile(0.5)
+        stats["pct75"] = self.digest.quantile(0.75)
+        stats["max"] = self.moments.max
+        stats["stdev"] = self.moments.pstdev()
+        if self.digest.is_exact():
+            # the centroids are the values, the median of their absolute deviations is exact
+            deviations = TDigest(self.digest.compression)
+            for mean, weight in self.digest.centroids():
+                deviations.add(abs(mean - stats["median"]), weight)
+            stats["mad"] = deviations.quantile(0.5)
+        else:
+            stats["mad"] = self._mad(stats["median"])
+        # medcouple of evenly spaced quantiles, these are the values themselves as long as the digest is exact
+        n = min(int(round(self.digest.total)), medcouple_sample or 4 * self.digest.compression)
+        if n < 3:
+            stats["medcouple"] = 0
+        else:
+            stats["medcouple"] = medcouple.medcouple_1d([self.digest.quantile(i / (n - 1.0)) for i in xrange(n)])
+        if medcouple_sample:
+            stats["medcouple_sample"] = n
+        return stats
+
+    def _mad(self, median):
+        """ Estimate the median absolute deviation by bisection: the interval [median - d, median + d] holds half of
+        the weight of the digest if d is the median absolute deviation.
+        """
+        low = 0.0
+        high = max(self.digest.max - median, median - self.digest.min)
+        for i in xrange(64):
+            d = (low + high) / 2
+            if self.digest.cdf(median + d) - self.digest.cdf(median - d) < 0.5:
+                low = d
+            else:
+                high = d
+        return (low + high) / 2
+
+    def to_json(self):
+        return {"moments": self.moments.to_json(), "digest": self.digest.to_json()}
+
+    @classmethod
+    def from_json(cls, state):
+        summary = cls()
+        summary.moments = Welford.from_json(state["moments"])
+        summary.digest = TDigest.from_json(state["digest"])
+        return summary
+
+class DecayedSummary(Summary):
+    """ Summary of a stream of timestamped values whose weights halve every half_life seconds, so the statistics
+    follow a drifting baseline. Uses forward decay (Cormode et al., "Forward Decay: A Practical Time Decay Model for
+    Streaming Systems"): a value observed at time t is added with the weight 2 ** ((t - landmark) / half_life), which
+    keeps adding a value O(1) and leaves older values untouched. The weights are rescaled to a later landmark only when
+    they grow large and before the statistics are calculated, where they become the effective number of values.
+    """
+
+    # rescale once the weights exceed 2 ** max_exponent
+    max_exponent = 64
+
+    def __init__(self, half_life, compression=100):
+        Summary.__init__(self, compression)
+        self.half_life = float(half_life)
+        self.landmark = None
+        self.latest = None
+        self.observations = 0
+
+    def append(self, x, t):
+        if self.landmark is None:
+            self.landmark = t
+        exponent = (t - self.landmark) / self.half_life
+        if exponent > self.max_exponent:
+            self._shift(t)
+            exponent = 0.0
+        weight = 2.0**exponent
+        if weight == 0.0:
+            # more than about 1075 half-lives older than the landmark, e.g. the events are read newest first
+            return
+        self.moments.add(x, weight)
+        self.digest.add(x, weight)
+        self.observations += 1
+        if self.latest is None or t > self.latest:
+            self.latest = t
+
+    def _shift(self, landmark):
+        """ Move the landmark, the weights are rescaled so that they decay from the new landmark """
+        factor = 2.0**((self.landmark - landmark) / self.half_life)
+        self.moments.scale(factor)
+        self.digest.scale(factor)
+        self.landmark = landmark
+
+    def merge(self, other):
+        """ Add the values of other, which is rescaled to the landmark of this summary if they differ """
+        if other.landmark is None:
+            return
+        if self.landmark is None:
+            self.landmark = other.landmark
+        elif other.landmark > self.landmark:
+            self._shift(other.landmark)
+        elif other.landmark < self.landmark:
+            other._shift(self.landmark)
+        Summary.merge(self, other)
+        self.observations += other.observations
+        if self.latest is None or other.latest > self.latest:
+            self.latest = other.latest
+
+    def statistics(self, medcouple_sample=None):
+        """ Return the statistics decayed to the latest observation """
+        if self.latest is not None and self.latest != self.landmark:
+            self._shift(self.latest)
+        stats = Summary.statistics(self, medcouple_sample)
+        # the effective number of values may be below 2 although stdev is defined
+        if self.observations >= 2:
+            stats["stdev"] = (self.moments.m2 / self.moments.count)**0.5
+        return stats
+
+    def to_json(self):
+        state = Summary.to_json(self)
+        state["half_life"] = self.half_life
+        state["landmark"] = self.landmark
+        state["latest"] = self.latest
+        state["observations"] = self.observations
+        return state
+
+    @classmethod
+    def from_json(cls, state):
+        summary = cls(state["half_life"])
+        summary.moments = Welford.from_json(state["moments"])
+        summary.digest = TDigest.from_json(state["digest"])
+        summary.landmark = state["landmark"]
+        summary.latest = state["latest"]
+        summary.observations = state["observations"]
+        return summary
@@ -31,6 +31,7 @@ import ssl
 import urllib
 import io
 import sys
+import threading
 
 from datetime import datetime
 from functools import wraps
@@ -47,7 +48,8 @@ __all__ = [
     "connect",
     "Context",
     "handler",
-    "HTTPError"
+    "HTTPError",
+    "pooled_handler"
 ]
 
 # If you change these, update the docstring
@@ -1185,16 +1187,10 @@ class ResponseReader(io.RawIOBase):
         return bytes_read
 
 
-def handler(key_file=None, cert_file=None, timeout=None):
-    """This class returns an instance of the default HTTP request handler using
+def _connector(key_file=None, cert_file=None, timeout=None):
+    """Returns a function opening an :class:`httplib.HTTPConnection` or
+    :class:`httplib.HTTPSConnection` for a given scheme, host and port using
     the values you provide.
-
-    :param `key_file`: A path to a PEM (Privacy Enhanced Mail) formatted file containing your private key (optional).
-    :type key_file: ``string``
-    :param `cert_file`: A path to a PEM (Privacy Enhanced Mail) formatted file containing a certificate chain file (optional).
-    :type cert_file: ``string``
-    :param `timeout`: The request time-out period, in seconds (optional).
-    :type timeout: ``integer`` or "None"
     """
 
     def connect(scheme, host, port):
@@ -1212,6 +1208,23 @@ def handler(key_file=None, cert_file=None, timeout=None):
             return httplib.HTTPSConnection(host, port, **kwargs)
         raise ValueError("unsupported scheme: %s" % scheme)
 
+    return connect
+
+
+def handler(key_file=None, cert_file=None, timeout=None):
+    """This class returns an instance of the default HTTP request handler using
+    the values you provide.
+
+    :param `key_file`: A path to a PEM (Privacy Enhanced Mail) formatted file containing your private key (optional).
+    :type key_file: ``string``
+    :param `cert_file`: A path to a PEM (Privacy Enhanced Mail) formatted file containing a certificate chain file (optional).
+    :type cert_file: ``string``
+    :param `timeout`: The request time-out period, in seconds (optional).
+    :type timeout: ``integer`` or "None"
+    """
+
+    connect = _connector(key_file, cert_file, timeout)
+
     def request(url, message, **kwargs):
         scheme, host, port, path = _spliturl(url)
         body = message.get("body", "")
@@ -1242,3 +1255,95 @@ def handler(key_file=None, cert_file=None, timeout=None):
         }
 
     return request
+
+
+def pooled_handler(key_file=None, cert_file=None, timeout=None, max_idle=8):
+    """This function returns an HTTP request handler which keeps persistent
+    HTTP/1.1 connections using the values you provide.
+
+    Unlike :func:`handler`, which opens and closes a connection for every
+    request, this handler returns connections to a pool per scheme, host and
+    port after a request and reuses them for the next request. Requests pay for
+    the TCP connect and TLS handshake only once per connection. The pool is
+    thread safe: concurrent callers each use a connection of their own and at
+    most `max_idle` idle connections per target are kept open.
+
+    The response body is read completely before the connection is returned to
+    the pool. If a reused connection turns out to be closed by the server, the
+    request is sent again on a new connection.
+
+    :param `key_file`: A path to a PEM (Privacy Enhanced Mail) formatted file containing your private key (optional).
+    :type key_file: ``string``
+    :param `cert_file`: A path to a PEM (Privacy Enhanced Mail) formatted file containing a certificate chain file (optional).
+    :type cert_file: ``string``
+    :param `timeout`: The request time-out period, in seconds (optional).
+    :type timeout: ``integer`` or "None"
+    :param `max_idle`: The maximum number of idle connections kept per scheme, host and port (optional).
+    :type max_idle: ``integer``
+    """
+
+    connect = _connector(key_file, cert_file, timeout)
+    idle = {}
+    lock = threading.Lock()
+
+    def acquire(target):
+        with lock:
+            connections = idle.get(target)
+            if connections:
+                return connections.pop(), True
+        return connect(*target), False
+
+    def release(target, connection):
+        with lock:
+            connections = idle.setdefault(target, [])
+            if len(connections) < max_idle:
+                connections.append(connection)
+                return
+        connection.close()
+
+    def request(url, message, **kwargs):
+        scheme, host, port, path = _spliturl(url)
+        body = message.get("body", "")
+        head = {
+            "Content-Length": str(len(body)),
+            "Host": host,
+            "User-Agent": "splunk-sdk-python/0.1",
+            "Accept": "*/*",
+        } # defaults
+        for key, value in message["headers"]:
+            head[key] = value
+        method = message.get("method", "GET")
+        target = (scheme, host, port)
+
+        while True:
+            connection, reused = acquire(target)
+            try:
+                connection.request(method, path, body, head)
+                if timeout is not None:
+                    connection.sock.settimeout(timeout)
+                response = connection.getresponse()
+                content = response.read()
+            except (httplib.HTTPException, socket.error):
+                connection.close()
+                if reused:
+                    # The server closed the idle connection, try again
+                    continue
+                raise
+            except:
+                connection.close()
+                raise
+            break
+
+        if response.will_close:
+            connection.close()
+        else:
+            release(target, connection)
+
+        return {
+            "status": response.status,
+            "reason": response.reason,
+            "headers": response.getheaders(),
+            "body": ResponseReader(StringIO(content)),
+        }
+
+    return request